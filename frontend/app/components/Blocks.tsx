@@ -1,6 +1,7 @@
 'use client'
 
 import { useState, useEffect } from 'react'
+import useEvents from './useEvents'
 
 interface BlocksProps {
   apiBase: string
@@ -24,12 +25,38 @@ export default function Blocks({ apiBase }: BlocksProps) {
     }
   }
 
+  // Cada evento trae la cabecera del bloque: se agrega sin volver a descargar la cadena.
+  // Las transacciones se piden solo al desplegar el bloque.
+  useEvents(apiBase, ['blocks'], (event) => {
+    if (event.type === 'new_block') {
+      setBlocks((current) => {
+        if (current.some((block) => block.index === event.index)) return current
+        const { type, ...header } = event
+        return [...current, header]
+      })
+    }
+  }, loadBlocks)
+
+  const loadBlockTransactions = async (hash: string) => {
+    try {
+      const response = await fetch(`${apiBase}/block/${hash}`)
+      const data = await response.json()
+      setBlocks((current) => current.map((block) => (block.hash === hash ? data : block)))
+    } catch (error) {
+      console.error('Error cargando transacciones del bloque:', error)
+    }
+  }
+
   const toggleBlock = (index: number) => {
     const newExpanded = new Set(expandedBlocks)
     if (newExpanded.has(index)) {
       newExpanded.delete(index)
     } else {
       newExpanded.add(index)
+      const block = blocks.find((b) => b.index === index)
+      if (block && !block.transactions) {
+        loadBlockTransactions(block.hash)
+      }
     }
     setExpandedBlocks(newExpanded)
   }
@@ -82,7 +109,7 @@ export default function Blocks({ apiBase }: BlocksProps) {
                   Hash: {block.hash}
                 </div>
                 <div style={{ fontSize: '12px', color: '#8a8fa3', marginTop: '8px' }}>
-                  Transacciones: {block.transactions.length} | Nonce: {block.nonce} | {new Date(block.timestamp).toLocaleString()}
+                  Transacciones: {block.transactions ? block.transactions.length : block.tx_count} | Nonce: {block.nonce} | {new Date(block.timestamp).toLocaleString()}
                 </div>
               </div>
               <div>
@@ -104,7 +131,7 @@ export default function Blocks({ apiBase }: BlocksProps) {
             </div>
             {expandedBlocks.has(block.index) && (
               <div style={{ marginTop: '16px', paddingTop: '16px', borderTop: '1px solid rgba(255, 255, 255, 0.1)' }}>
-                {block.transactions.map((tx: any, idx: number) => (
+                {(block.transactions || []).map((tx: any, idx: number) => (
                   <div key={idx} style={{ background: 'rgba(255, 255, 255, 0.02)', border: '1px solid rgba(255, 255, 255, 0.05)', borderRadius: '6px', padding: '12px', marginBottom: '8px' }}>
                     <div style={{ fontFamily: 'monospace', fontSize: '11px', color: '#8a8fa3', marginBottom: '8px' }}>
                       Hash: {tx.hash}
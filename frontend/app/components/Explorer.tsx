@@ -1,6 +1,7 @@
 'use client'
 
 import { useState, useEffect } from 'react'
+import useEvents from './useEvents'
 
 interface ExplorerProps {
   apiBase: string
@@ -21,6 +22,16 @@ export default function Explorer({ apiBase }: ExplorerProps) {
     loadPendingTransactions()
   }, [])
 
+  // Los eventos traen los datos necesarios (cabecera del bloque, tamaño del mempool):
+  // se actualiza el estado sin nuevas consultas. La lista de pendientes se pide a demanda.
+  useEvents(apiBase, ['blocks', 'mempool'], (event) => {
+    if (event.type === 'new_block') {
+      setChainInfo((info: any) => (info ? { ...info, length: Math.max(info.length, event.index + 1) } : info))
+    } else if (event.type === 'mempool_update') {
+      setChainInfo((info: any) => (info ? { ...info, pending_transactions: event.pending_count } : info))
+    }
+  }, () => loadChainInfo())
+
   const loadChainInfo = async () => {
     try {
       const response = await fetch(`${apiBase}/chain/info`)
@@ -41,6 +52,9 @@ export default function Explorer({ apiBase }: ExplorerProps) {
     }
   }
 
+  // Tamaño actual del mempool (actualizado por eventos); la lista puede ser una instantánea anterior
+  const pendingCount: number = chainInfo?.pending_transactions ?? pendingTransactions.length
+
   const mineBlock = async () => {
     if (!miningAddress.trim()) {
       alert('Por favor ingresa una dirección para recibir la recompensa de minería')
@@ -237,6 +251,11 @@ export default function Explorer({ apiBase }: ExplorerProps) {
         <button className="btn btn-secondary" onClick={loadPendingTransactions} style={{ marginBottom: '16px' }}>
           Actualizar Lista
         </button>
+        {pendingCount !== pendingTransactions.length && (
+          <div style={{ fontSize: '13px', color: '#f0b90b', marginBottom: '16px' }}>
+            El mempool tiene ahora {pendingCount} transacción(es) pendiente(s); pulsa "Actualizar Lista" para verlas
+          </div>
+        )}
         {pendingTransactions.length === 0 ? (
           <div style={{ textAlign: 'center', padding: '40px', color: '#8a8fa3' }}>
             No hay transacciones pendientes
@@ -299,9 +318,9 @@ export default function Explorer({ apiBase }: ExplorerProps) {
         <button 
           className="btn btn-primary" 
           onClick={mineBlock}
-          disabled={miningResult?.loading || pendingTransactions.length === 0}
+          disabled={miningResult?.loading || pendingCount === 0}
         >
-          {miningResult?.loading ? 'Minando...' : `Minar Bloque (${pendingTransactions.length} TX pendientes)`}
+          {miningResult?.loading ? 'Minando...' : `Minar Bloque (${pendingCount} TX pendientes)`}
         </button>
         {miningResult && (
           <div style={{ marginTop: '20px' }}>
@@ -0,0 +1,63 @@
+'use client'
+
+import { useEffect, useRef } from 'react'
+
+// Suscripción a /ws/events. Tras una reconexión se llama una vez a onResync
+// para recuperar los eventos perdidos mientras el WebSocket estuvo caído.
+export default function useEvents(
+  apiBase: string,
+  channels: string[],
+  onEvent: (event: any) => void,
+  onResync: () => void
+) {
+  const onEventRef = useRef(onEvent)
+  const onResyncRef = useRef(onResync)
+  onEventRef.current = onEvent
+  onResyncRef.current = onResync
+
+  const channelList = channels.join(',')
+
+  useEffect(() => {
+    if (!apiBase) return
+
+    let socket: WebSocket | null = null
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null
+    let stopped = false
+    let disconnected = false
+
+    const connect = () => {
+      const url = new URL(apiBase)
+      const protocol = url.protocol === 'https:' ? 'wss' : 'ws'
+      socket = new WebSocket(`${protocol}://${url.host}/ws/events?channels=${encodeURIComponent(channelList)}`)
+
+      socket.onopen = () => {
+        if (disconnected) {
+          disconnected = false
+          onResyncRef.current()
+        }
+      }
+
+      socket.onmessage = (event) => {
+        try {
+          onEventRef.current(JSON.parse(event.data))
+        } catch (e) {
+          console.error('Error procesando evento:', e)
+        }
+      }
+
+      socket.onclose = () => {
+        if (stopped) return
+        disconnected = true
+        reconnectTimer = setTimeout(connect, 5000)
+      }
+    }
+
+    connect()
+
+    return () => {
+      stopped = true
+      if (reconnectTimer !== null) clearTimeout(reconnectTimer)
+      if (socket) socket.close()
+    }
+  }, [apiBase, channelList])
+}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Valida la cadena completa leyéndola en streaming desde PostgreSQL
+(cursor del lado del servidor): la memoria se mantiene constante sin
+importar el largo de la cadena.
+Uso: python scripts/validate_chain.py [--from INDICE] [--batch-size N]
+"""
+
+import sys
+import os
+import argparse
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database import db
+from src.chain_validation import validate_stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida la cadena de bloques en streaming")
+    parser.add_argument('--from', dest='start', type=int, default=0,
+                        help="Índice del primer bloque a validar (por defecto, el génesis)")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="Filas que entrega PostgreSQL por lote")
+    args = parser.parse_args()
+
+    db.initialize()
+
+    previous_hash = None
+    if args.start > 0:
+        previous_hash = db.get_block_hash(args.start - 1)
+        if previous_hash is None:
+            print(f"❌ No existe el bloque #{args.start - 1}")
+            return 2
+
+    started = time.monotonic()
+    result = validate_stream(db.iter_blocks(args.start, itersize=args.batch_size), previous_hash)
+    elapsed = time.monotonic() - started
+
+    print(f"Bloques validados: {result['validated']} en {elapsed:.2f}s")
+    if result['is_valid']:
+        print(f"✓ Cadena válida (altura {result['height']})")
+        return 0
+    print(f"❌ Cadena inválida (bloque #{result['invalid_index']})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+from src.config import settings
+from src.redis_client import redis_client
+from typing import Dict, List
+
+
+class AdmissionError(Exception):
+    """Error de admisión de transacciones; se traduce a una respuesta HTTP con Retry-After"""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = max(int(retry_after), 1)
+
+
+class MempoolFullError(AdmissionError):
+    """El mempool superó el límite de profundidad o de bytes"""
+    status_code = 503
+
+
+class RateLimitError(AdmissionError):
+    """El remitente agotó su cuota de transacciones"""
+    status_code = 429
+
+
+# Token bucket por remitente. Concede hasta ARGV[3] tokens y retorna
+# {tokens concedidos, segundos hasta que haya un token disponible}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(math.floor(tokens), requested)
+tokens = tokens - granted
+local retry_after = 0
+if granted < requested then
+  retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {granted, retry_after}
+"""
+
+
+class AdmissionController:
+    """
+    Control de admisión del mempool: límites de profundidad/bytes y
+    cuotas por remitente (token bucket en Redis).
+    Si Redis no responde, se admite la transacción (fail-open).
+    """
+
+    def __init__(self):
+        self._token_bucket = None
+
+    def check_mempool_capacity(self, incoming_count: int = 1, incoming_bytes: int = 0) -> None:
+        """Lanza MempoolFullError si el mempool no admite `incoming_count` transacciones más"""
+        max_count = settings.MEMPOOL_MAX_TRANSACTIONS
+        max_bytes = settings.MEMPOOL_MAX_BYTES
+        if max_count <= 0 and max_bytes <= 0:
+            return
+        try:
+            if redis_client.client is None:
+                redis_client.initialize()
+            count, size = redis_client.get_mempool_usage()
+        except Exception as e:
+            print(f"⚠️  No se pudo consultar el tamaño del mempool: {e}")
+            return
+
+        if max_count > 0 and count + incoming_count > max_count:
+            raise MempoolFullError(
+                f"Mempool lleno ({count}/{max_count} transacciones pendientes)",
+                settings.MEMPOOL_RETRY_AFTER
+            )
+        if max_bytes > 0 and size + incoming_bytes > max_bytes:
+            raise MempoolFullError(
+                f"Mempool lleno ({size}/{max_bytes} bytes pendientes)",
+                settings.MEMPOOL_RETRY_AFTER
+            )
+
+    def consume_sender_quotas(self, requested: Dict[str, int]) -> Dict[str, tuple]:
+        """
+        Consume tokens de la cuota de cada remitente.
+        requested: {remitente: número de transacciones}
+        Retorna {remitente: (transacciones concedidas, retry_after)}
+        """
+        rate = settings.SENDER_RATE_LIMIT
+        if rate <= 0 or not requested:
+            return {sender: (count, 0) for sender, count in requested.items()}
+        burst = max(settings.SENDER_RATE_BURST, 1)
+        senders: List[str] = list(requested)
+        try:
+            if redis_client.client is None:
+                redis_client.initialize()
+            if self._token_bucket is None:
+                self._token_bucket = redis_client.client.register_script(TOKEN_BUCKET_SCRIPT)
+            pipe = redis_client.client.pipeline(transaction=False)
+            for sender in senders:
+                self._token_bucket(
+                    keys=[f"ratelimit:sender:{sender.lower()}"],
+                    args=[rate, burst, requested[sender]],
+                    client=pipe
+                )
+            replies = pipe.execute()
+        except Exception as e:
+            print(f"⚠️  No se pudo aplicar la cuota por remitente: {e}")
+            return {sender: (count, 0) for sender, count in requested.items()}
+        return {sender: (int(granted), int(retry_after)) for sender, (granted, retry_after) in zip(senders, replies)}
+
+
+admission_controller = AdmissionController()
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Optional, Dict
@@ -10,6 +11,9 @@ from src.wallet import wallet_manager
 from src.utils import parse_amount, format_amount
 from src.auth import create_access_token, verify_token, verify_signature, create_auth_message
 from src.celery_app import celery_app
+from src.admission import admission_controller, AdmissionError
+from src.idempotency import idempotency_store, IdempotencyError
+from src.locks import LockNotAcquired
 from src.tasks import (
     mine_block_task,
     process_transaction_task,
@@ -20,11 +24,14 @@ from src.tasks import (
 import uvicorn
 from src.config import settings
 import os
+import json
 import asyncio
-import threading
+from datetime import datetime, timedelta
 
-from src.websocket_manager import ws_manager
-from src.rabbitmq_client import RabbitMQClient
+from src.websocket_manager import ws_manager, events_manager
+from src.redis_client import redis_client
+from src.balance_tracker import balance_tracker
+from src.async_rabbitmq_client import async_rabbitmq_client
 
 security = HTTPBearer()
 
@@ -51,66 +58,122 @@ if os.path.exists(frontend_dir):
 @app.on_event("startup")
 async def startup_event():
     """
-    Arranca un consumidor de RabbitMQ en un hilo separado para enviar
-    actualizaciones en tiempo real a través de WebSocket.
+    Conecta el cliente AMQP asíncrono: la API publica transacciones y bloques
+    sin bloquear el event loop y consume la cola de bloques sobre el propio
+    loop para enviar actualizaciones en tiempo real a través de WebSocket.
     """
-    loop = asyncio.get_event_loop()
+    try:
+        await async_rabbitmq_client.initialize()
+    except Exception as e:
+        print(f"Error inicializando RabbitMQ (asyncio) para la API: {e}")
+        return
+    get_blockchain_service().publisher = async_rabbitmq_client
+
+    # Con el backplane, cada evento lo procesa una sola réplica (cola compartida)
+    # y lo entrega por Redis pub/sub a las conexiones de todas las réplicas
+    backplane = settings.WS_BACKPLANE_ENABLED
+    if backplane:
+        try:
+            await ws_manager.enable_backplane()
+            await events_manager.enable_backplane()
+        except Exception as e:
+            print(f"Error conectando el backplane de WebSocket; se usa entrega local: {e}")
+            backplane = False
 
-    def consume_blocks():
-        client = RabbitMQClient()
+    async def handle_block(block_data: dict):
+        # Para cada bloque minado, notificamos a las direcciones suscritas afectadas
         try:
-            client.initialize()
+            if backplane:
+                affected = await ws_manager.subscribed_keys(block_data.get("balance_deltas", {}))
+                balances = await balance_tracker.fetch(affected)
+            else:
+                balances = await balance_tracker.apply_block(block_data, ws_manager.addresses())
+
+            header = {key: value for key, value in block_data.items() if key != "balance_deltas"}
+            await events_manager.publish("blocks", dict(header, type="new_block"))
+
+            for address, balance_wei in balances.items():
+                message = {
+                    "type": "balance_update",
+                    "address": address,
+                    "balance": balance_wei,
+                    "balance_formatted": format_amount(balance_wei),
+                    "source": "block_mined",
+                    "block_index": block_data.get("index"),
+                    "block_hash": block_data.get("hash"),
+                }
+                await ws_manager.publish(address, message)
         except Exception as e:
-            print(f"Error inicializando RabbitMQ para WebSockets: {e}")
-            return
+            print(f"Error manejando bloque para WebSockets: {e}")
 
-        def handle_block(block_data: dict):
-            # Para cada bloque minado, notificamos a las direcciones afectadas
+    async def handle_task_event(event: dict):
+        await events_manager.publish(f"task:{event.get('task_id')}", dict(event, type="task_completed"))
+
+    async def push_mempool_updates():
+        # Una consulta por réplica e intervalo, sin importar cuántos clientes haya suscritos
+        last_usage = None
+        while True:
+            await asyncio.sleep(settings.MEMPOOL_PUSH_INTERVAL_MS / 1000)
+            if not events_manager.has_subscribers("mempool"):
+                last_usage = None
+                continue
             try:
-                from src.utils import format_amount
-                affected_addresses = set()
-                transactions = block_data.get("transactions", [])
-                for tx in transactions:
-                    sender = (tx.get("sender") or "").lower()
-                    recipient = (tx.get("recipient") or "").lower()
-                    if sender and sender != "sistema":
-                        affected_addresses.add(sender)
-                    if recipient:
-                        affected_addresses.add(recipient)
-
-                if not affected_addresses:
-                    return
-
-                blockchain = get_blockchain_service()
-
-                for address in affected_addresses:
-                    try:
-                        balance_wei = blockchain.get_balance(address)
-                        balance_formatted = format_amount(balance_wei)
-                    except Exception as e:
-                        print(f"Error obteniendo balance para {address}: {e}")
-                        continue
-
-                    message = {
-                        "type": "balance_update",
-                        "address": address,
-                        "balance": balance_wei,
-                        "balance_formatted": balance_formatted,
-                        "source": "block_mined",
-                        "block_index": block_data.get("index"),
-                        "block_hash": block_data.get("hash"),
-                    }
-                    asyncio.run_coroutine_threadsafe(
-                        ws_manager.send_personal_message(address, message),
-                        loop,
-                    )
+                usage = await asyncio.to_thread(redis_client.get_mempool_usage)
             except Exception as e:
-                print(f"Error manejando bloque para WebSockets: {e}")
+                print(f"Error consultando el tamaño del mempool: {e}")
+                continue
+            if usage != last_usage:
+                last_usage = usage
+                await events_manager.send_personal_message("mempool", {
+                    "type": "mempool_update",
+                    "pending_count": usage[0],
+                    "pending_bytes": usage[1],
+                })
+
+    asyncio.create_task(async_rabbitmq_client.consume_blocks(handle_block, shared=backplane))
+    asyncio.create_task(async_rabbitmq_client.consume_task_events(handle_task_event, shared=backplane))
+    asyncio.create_task(push_mempool_updates())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Vacía el buffer de publicación de RabbitMQ antes de terminar"""
+    await async_rabbitmq_client.close()
+    await ws_manager.close()
+    await events_manager.close()
+
+
+def admission_http_exception(error: AdmissionError) -> HTTPException:
+    """Traduce un rechazo del control de admisión a 429/503 con Retry-After"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
 
-        client.consume_blocks(handle_block)
 
-    thread = threading.Thread(target=consume_blocks, daemon=True)
-    thread.start()
+async def run_idempotent(scope: str, idempotency_key: Optional[str], payload: dict, handler):
+    """
+    Ejecuta `handler` respetando la cabecera Idempotency-Key: los reintentos con
+    la misma clave y el mismo cuerpo devuelven la respuesta original sin repetir
+    el trabajo.
+    """
+    if not idempotency_key:
+        return await handler()
+    # Las llamadas a Redis van al threadpool para no bloquear el event loop
+    try:
+        cached = await run_in_threadpool(idempotency_store.begin, scope, idempotency_key, payload)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if cached is not None:
+        return JSONResponse(content=cached, headers={"Idempotent-Replayed": "true"})
+    try:
+        response = await handler()
+    except Exception:
+        await run_in_threadpool(idempotency_store.release, scope, idempotency_key)
+        raise
+    await run_in_threadpool(idempotency_store.complete, scope, idempotency_key, payload, response)
+    return response
 
 
 # Dependencia para obtener el usuario autenticado
@@ -214,9 +277,53 @@ async def wallet_websocket(websocket: WebSocket, address: str):
             # Por ahora ignoramos mensajes del cliente; se podría usar para pings
             await websocket.receive_text()
     except WebSocketDisconnect:
-        await ws_manager.disconnect(address, websocket)
+        pass
+    except Exception:
+        pass
+    await ws_manager.disconnect(address, websocket)
+    if address.lower() not in ws_manager.addresses():
+        balance_tracker.forget(address)
+
+
+@app.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, channels: str = "blocks"):
+    """
+    WebSocket de eventos en tiempo real (alternativa a consultar periódicamente
+    /chain, /chain/info, /transactions/pending y /tasks/{task_id}).
+    channels: lista separada por comas de
+      - "blocks":     {"type": "new_block", "index", "hash", "previous_hash", "timestamp", "nonce", "tx_count"}
+      - "mempool":    {"type": "mempool_update", "pending_count", "pending_bytes"} (solo cuando cambia)
+      - "task:<id>":  {"type": "task_completed", "task_id", "task_name", "state"}
+    """
+    keys = {channel.strip() for channel in channels.split(",") if channel.strip()}
+    await events_manager.subscribe(keys, websocket)
+    try:
+        # Estado inicial: tareas que ya terminaron antes de la suscripción y tamaño actual del mempool
+        for key in keys:
+            if key.startswith("task:"):
+                task_id = key[len("task:"):]
+                task = celery_app.AsyncResult(task_id)
+                if task.ready():
+                    await events_manager.send_personal_message(key, {
+                        "type": "task_completed",
+                        "task_id": task_id,
+                        "task_name": task.name,
+                        "state": task.state,
+                    })
+        if "mempool" in keys:
+            pending_count, pending_bytes = await asyncio.to_thread(redis_client.get_mempool_usage)
+            await events_manager.send_personal_message("mempool", {
+                "type": "mempool_update",
+                "pending_count": pending_count,
+                "pending_bytes": pending_bytes,
+            })
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
     except Exception:
-        await ws_manager.disconnect(address, websocket)
+        pass
+    await events_manager.unsubscribe(keys, websocket)
 
 
 @app.get("/chain/info")
@@ -228,25 +335,43 @@ async def get_chain_info():
 
 
 @app.get("/chain/validate")
-async def validate_chain():
+async def validate_chain(full: bool = False):
+    """
+    Valida la cadena de forma incremental desde el último checkpoint.
+    full=true revalida desde el génesis.
+    """
     try:
-        is_valid = blockchain_service().is_chain_valid()
-        return {"is_valid": is_valid}
+        validation = blockchain_service().validate_chain(full=full)
+        return {
+            "is_valid": validation["is_valid"],
+            "invalid_index": validation["invalid_index"],
+            "validated_height": validation["height"]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/transactions/new")
-async def create_transaction(transaction: TransactionRequest, async_mode: bool = False):
+async def create_transaction(
+    transaction: TransactionRequest,
+    async_mode: bool = False,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Crea una nueva transacción
     - async_mode=False: Procesa de forma síncrona (default)
     - async_mode=True: Procesa de forma asíncrona con Celery
+    - Idempotency-Key (cabecera opcional): los reintentos devuelven la respuesta original
     """
-    """
-    Crea una nueva transacción
-    async_mode: Si es True, procesa la transacción de forma asíncrona con Celery
-    """
+    return await run_idempotent(
+        "transactions/new",
+        idempotency_key,
+        {"transaction": transaction.model_dump(), "async_mode": async_mode},
+        lambda: _create_transaction(transaction, async_mode)
+    )
+
+
+async def _create_transaction(transaction: TransactionRequest, async_mode: bool):
     try:
         # Validar y convertir el monto a wei (entero)
         amount_wei = parse_amount(transaction.amount)
@@ -255,6 +380,8 @@ async def create_transaction(transaction: TransactionRequest, async_mode: bool =
             raise HTTPException(status_code=400, detail="El monto debe ser mayor a 0")
         
         if async_mode:
+            # Rechazar rápido si el mempool ya está lleno
+            await run_in_threadpool(admission_controller.check_mempool_capacity, 1)
             # Procesar de forma asíncrona con Celery
             task = process_transaction_task.delay(
                 transaction.sender,
@@ -273,25 +400,29 @@ async def create_transaction(transaction: TransactionRequest, async_mode: bool =
             }
         else:
             # Procesar de forma síncrona (comportamiento original)
-            success = blockchain_service().add_transaction(
-                transaction.sender,
-                transaction.recipient,
-                float(transaction.amount)
-            )
+            # Fuera del event loop: Postgres, Redis y el envío a Celery del minado automático bloquean
+            result = (await run_in_threadpool(blockchain_service().add_transactions_batch, [{
+                "sender": transaction.sender,
+                "recipient": transaction.recipient,
+                "amount": float(transaction.amount)
+            }]))[0]
             
-            if success:
+            if result["success"]:
                 return {
                     "message": "Transacción agregada exitosamente",
                     "transaction": {
+                        "hash": result["hash"],
                         "sender": transaction.sender,
                         "recipient": transaction.recipient,
                         "amount": transaction.amount
                     }
                 }
             else:
-                raise HTTPException(status_code=500, detail="Error al agregar transacción")
+                raise HTTPException(status_code=400, detail=result["error"])
     except HTTPException:
         raise
+    except AdmissionError as e:
+        raise admission_http_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -327,7 +458,8 @@ async def mine_block(mining_request: MiningRequest, async_mode: bool = True):
             }
         else:
             # Minar de forma síncrona (comportamiento original)
-            block = blockchain_service().mine_pending_transactions(
+            block = await run_in_threadpool(
+                blockchain_service().mine_pending_transactions,
                 mining_reward_address=mining_request.mining_reward_address,
                 include_reward=True
             )
@@ -346,6 +478,14 @@ async def mine_block(mining_request: MiningRequest, async_mode: bool = True):
                 }
             else:
                 raise HTTPException(status_code=500, detail="Error al minar bloque")
+    except LockNotAcquired:
+        raise HTTPException(
+            status_code=409,
+            detail="Otro minero está produciendo un bloque",
+            headers={"Retry-After": "5"}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -468,33 +608,46 @@ async def get_auth_message(address: str):
 @app.post("/transactions/transfer")
 async def transfer_funds(
     transaction: AuthenticatedTransactionRequest,
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Crea una transacción usando la wallet autenticada"""
+    """Crea una transacción usando la wallet autenticada (admite cabecera Idempotency-Key)"""
+    return await run_idempotent(
+        f"transactions/transfer:{current_user.lower()}",
+        idempotency_key,
+        transaction.model_dump(),
+        lambda: _transfer_funds(transaction, current_user)
+    )
+
+
+async def _transfer_funds(transaction: AuthenticatedTransactionRequest, current_user: str):
     try:
         if not wallet_manager.verify_address(transaction.recipient):
             raise HTTPException(status_code=400, detail="Dirección del destinatario inválida")
         
         # Usar la dirección autenticada como remitente
-        success = blockchain_service().add_transaction(
-            current_user,
-            transaction.recipient,
-            transaction.amount
-        )
+        result = (await run_in_threadpool(blockchain_service().add_transactions_batch, [{
+            "sender": current_user,
+            "recipient": transaction.recipient,
+            "amount": transaction.amount
+        }]))[0]
         
-        if success:
+        if result["success"]:
             return {
                 "message": "Transacción creada exitosamente",
                 "transaction": {
+                    "hash": result["hash"],
                     "sender": current_user,
                     "recipient": transaction.recipient,
                     "amount": transaction.amount
                 }
             }
         else:
-            raise HTTPException(status_code=500, detail="Error al crear transacción")
+            raise HTTPException(status_code=400, detail=result["error"])
     except HTTPException:
         raise
+    except AdmissionError as e:
+        raise admission_http_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -645,9 +798,25 @@ async def get_address_transactions(address: str):
 
 # ==================== Endpoints de Celery ====================
 
+def expand_task_result(result):
+    """Agrega al resumen de un bloque minado sus transacciones, leídas de PostgreSQL"""
+    if not isinstance(result, dict) or not isinstance(result.get('block'), dict):
+        return result
+    block_hash = result['block'].get('hash')
+    block = blockchain_service().get_block_by_hash(block_hash) if block_hash else None
+    if block is None:
+        return result
+    expanded_block = dict(result['block'], transactions=[tx.to_dict() for tx in block.transactions])
+    return dict(result, block=expanded_block)
+
+
 @app.get("/tasks/{task_id}")
-async def get_task_status(task_id: str):
-    """Obtiene el estado de una tarea Celery"""
+async def get_task_status(task_id: str, expand: bool = False):
+    """
+    Obtiene el estado de una tarea Celery.
+    Los resultados guardan resúmenes (p. ej. hash del bloque minado);
+    expand=true agrega las transacciones del bloque desde PostgreSQL.
+    """
     try:
         task = celery_app.AsyncResult(task_id)
         
@@ -669,7 +838,7 @@ async def get_task_status(task_id: str):
                 'task_id': task_id,
                 'state': task.state,
                 'status': 'Tarea completada exitosamente',
-                'result': task.result
+                'result': await run_in_threadpool(expand_task_result, task.result) if expand else task.result
             }
         else:
             response = {
@@ -685,10 +854,14 @@ async def get_task_status(task_id: str):
 
 
 @app.post("/tasks/validate-chain")
-async def validate_chain_async():
-    """Valida la cadena de forma asíncrona"""
+async def validate_chain_async(full: bool = False, parallel: bool = False, stream: bool = False):
+    """
+    Valida la cadena de forma asíncrona (full=true: desde el génesis;
+    parallel=true: revalidación completa repartida por rangos entre los workers;
+    stream=true: revalidación completa en streaming desde PostgreSQL)
+    """
     try:
-        task = validate_chain_task.delay()
+        task = validate_chain_task.delay(full=full, parallel=parallel, stream=stream)
         return {
             "message": "Validación iniciada (modo asíncrono)",
             "task_id": task.id,
@@ -717,10 +890,24 @@ class BatchTransactionRequest(BaseModel):
 
 
 @app.post("/transactions/batch")
-async def batch_create_transactions(batch_request: BatchTransactionRequest, async_mode: bool = True):
-    """Crea múltiples transacciones en lote"""
+async def batch_create_transactions(
+    batch_request: BatchTransactionRequest,
+    async_mode: bool = True,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Crea múltiples transacciones en lote (admite cabecera Idempotency-Key)"""
+    return await run_idempotent(
+        "transactions/batch",
+        idempotency_key,
+        {"transactions": batch_request.transactions, "async_mode": async_mode},
+        lambda: _batch_create_transactions(batch_request, async_mode)
+    )
+
+
+async def _batch_create_transactions(batch_request: BatchTransactionRequest, async_mode: bool):
     try:
         if async_mode:
+            await run_in_threadpool(admission_controller.check_mempool_capacity, len(batch_request.transactions))
             task = batch_process_transactions_task.delay(batch_request.transactions)
             return {
                 "message": "Procesamiento en lote iniciado (modo asíncrono)",
@@ -729,24 +916,7 @@ async def batch_create_transactions(batch_request: BatchTransactionRequest, asyn
                 "total_transactions": len(batch_request.transactions)
             }
         else:
-            results = []
-            for tx in batch_request.transactions:
-                try:
-                    success = blockchain_service().add_transaction(
-                        tx['sender'],
-                        tx['recipient'],
-                        float(tx['amount'])
-                    )
-                    results.append({
-                        "success": success,
-                        "transaction": tx
-                    })
-                except Exception as e:
-                    results.append({
-                        "success": False,
-                        "transaction": tx,
-                        "error": str(e)
-                    })
+            results = await run_in_threadpool(blockchain_service().add_transactions_batch, batch_request.transactions)
             
             return {
                 "message": "Lote procesado",
@@ -754,10 +924,120 @@ async def batch_create_transactions(batch_request: BatchTransactionRequest, asyn
                 "total": len(results),
                 "success_count": sum(1 for r in results if r['success'])
             }
+    except AdmissionError as e:
+        raise admission_http_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class IngestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse cuyo generador también lee el cuerpo de la petición.
+    StreamingResponse escucha la desconexión del cliente llamando a receive()
+    en paralelo y descarta los mensajes http.request que recibe, lo que haría
+    perder fragmentos del cuerpo; aquí el generador es el único lector de
+    receive (request.stream() ya detecta la desconexión).
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _iter_ndjson_lines(request: Request):
+    """
+    Lee el cuerpo de la petición de forma incremental y produce una línea
+    (bytes, sin el salto de línea) cada vez. Las líneas que exceden
+    INGEST_MAX_LINE_BYTES se descartan para mantener la memoria acotada.
+    """
+    buffer = bytearray()
+    oversized = False
+    async for data in request.stream():
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end == -1:
+                if not oversized:
+                    buffer += data[start:]
+                    if len(buffer) > settings.INGEST_MAX_LINE_BYTES:
+                        buffer.clear()
+                        oversized = True
+                break
+            if oversized:
+                yield None
+            else:
+                buffer += data[start:end]
+                yield bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = end + 1
+    if oversized:
+        yield None
+    elif buffer.strip():
+        yield bytes(buffer)
+
+
+@app.post("/transactions/stream")
+async def stream_transactions(request: Request):
+    """
+    Ingesta continua de transacciones en formato NDJSON (una transacción JSON por línea).
+    El cuerpo se procesa de forma incremental y las transacciones se agregan al
+    mempool en bloques de INGEST_CHUNK_SIZE. La respuesta es NDJSON con un
+    resultado por línea recibida y un resumen final.
+    """
+    async def ingest():
+        line_number = 0
+        total = 0
+        success_count = 0
+        chunk = []  # (número de línea, transacción)
+
+        async def flush():
+            nonlocal success_count
+            items = [item for _, item in chunk]
+            try:
+                results = await run_in_threadpool(blockchain_service().add_transactions_batch, items)
+            except AdmissionError as e:
+                results = [{"success": False, "error": str(e), "retry_after": e.retry_after} for _ in items]
+            except Exception as e:
+                results = [{"success": False, "error": str(e)} for _ in items]
+            output = []
+            for (number, _), result in zip(chunk, results):
+                entry = {"line": number, "success": result["success"]}
+                if result["success"]:
+                    entry["hash"] = result.get("hash")
+                    success_count += 1
+                else:
+                    entry["error"] = result.get("error")
+                    if result.get("retry_after"):
+                        entry["retry_after"] = result["retry_after"]
+                output.append(json.dumps(entry) + "\n")
+            chunk.clear()
+            return "".join(output)
+
+        async for raw_line in _iter_ndjson_lines(request):
+            line_number += 1
+            if raw_line is not None and not raw_line.strip():
+                continue
+            total += 1
+            if raw_line is None:
+                yield json.dumps({"line": line_number, "success": False, "error": "Línea demasiado larga"}) + "\n"
+                continue
+            try:
+                chunk.append((line_number, json.loads(raw_line)))
+            except Exception as e:
+                yield json.dumps({"line": line_number, "success": False, "error": f"JSON inválido: {e}"}) + "\n"
+                continue
+            if len(chunk) >= settings.INGEST_CHUNK_SIZE:
+                yield await flush()
+
+        if chunk:
+            yield await flush()
+        yield json.dumps({"summary": {"total": total, "success_count": success_count}}) + "\n"
+
+    return IngestStreamingResponse(ingest(), media_type="application/x-ndjson")
+
+
 @app.get("/financial/report")
 async def get_financial_report():
     """Genera un reporte financiero completo de la blockchain"""
@@ -768,6 +1048,30 @@ async def get_financial_report():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/financial/timeseries")
+async def get_financial_timeseries(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day"
+):
+    """
+    Transacciones y volumen por hora o por día en el intervalo [start, end)
+    (por defecto, los últimos 7 días o las últimas 24 horas)
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity debe ser 'hour' o 'day'")
+    end = end or datetime.now()
+    start = start or end - (timedelta(hours=24) if granularity == "hour" else timedelta(days=7))
+    if start.tzinfo is not None or end.tzinfo is not None:
+        raise HTTPException(status_code=400, detail="Las fechas deben indicarse sin zona horaria")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start debe ser anterior a end")
+    try:
+        return await run_in_threadpool(blockchain_service().get_volume_timeseries, start, end, granularity)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/{path:path}")
 async def serve_frontend(path: str):
     """Sirve archivos estáticos del frontend Next.js para rutas no-API"""
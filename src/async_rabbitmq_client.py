@@ -0,0 +1,224 @@
+import aio_pika
+import asyncio
+from src.config import settings
+from src.models import Transaction, Block
+from src.rabbitmq_client import QUEUES, coalesce_messages, destination
+from src import wire
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class AsyncRabbitMQClient:
+    """
+    Cliente AMQP nativo de asyncio (aio-pika) para el proceso de la API.
+    Consume y publica sobre el event loop: los métodos publish_* no bloquean
+    (encolan en un asyncio.Queue acotado) y pueden llamarse desde el loop o
+    desde hilos del threadpool. Una tarea del loop agrupa y publica los
+    mensajes con confirmaciones del broker; connect_robust reconecta solo.
+    """
+
+    def __init__(self):
+        self.connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self.channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._exchanges: Dict[str, aio_pika.abc.AbstractExchange] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffer: Optional[asyncio.Queue] = None
+        self._publisher_task: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    async def initialize(self):
+        try:
+            self._loop = asyncio.get_running_loop()
+            self._buffer = asyncio.Queue(maxsize=settings.RABBITMQ_PUBLISH_BUFFER)
+            self.connection = await aio_pika.connect_robust(settings.rabbitmq_url)
+            self.channel = await self.connection.channel(publisher_confirms=True)
+            for queue_name in QUEUES:
+                await self.channel.declare_queue(queue_name, durable=True)
+            self._exchanges[''] = self.channel.default_exchange
+            for exchange in (settings.BLOCK_EVENTS_EXCHANGE, settings.TASK_EVENTS_EXCHANGE):
+                self._exchanges[exchange] = await self._declare_fanout_exchange(self.channel, exchange)
+            self._publisher_task = asyncio.create_task(self._run_publisher())
+            print("Conexión asíncrona a RabbitMQ establecida correctamente")
+        except Exception as e:
+            print(f"Error conectando a RabbitMQ (asyncio): {e}")
+            raise
+
+    @staticmethod
+    async def _declare_fanout_exchange(channel, name: str) -> aio_pika.abc.AbstractExchange:
+        return await channel.declare_exchange(name, aio_pika.ExchangeType.FANOUT, durable=True)
+
+    # ==================== Publicación ====================
+
+    def _put(self, item) -> bool:
+        try:
+            self._buffer.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self._dropped += 1
+            if self._dropped % 1000 == 1:
+                print(f"⚠️  Buffer de publicación asíncrono lleno; mensajes descartados: {self._dropped}")
+            return False
+
+    def _enqueue(self, routing_key: str, payload) -> bool:
+        """Encola un mensaje sin bloquear, desde el loop o desde otro hilo"""
+        if self._loop is None or self._buffer is None:
+            print("⚠️  Cliente asíncrono de RabbitMQ no inicializado; mensaje descartado")
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return self._put((routing_key, payload))
+        self._loop.call_soon_threadsafe(self._put, (routing_key, payload))
+        return True
+
+    async def _next_batch(self) -> list:
+        batch = [await self._buffer.get()]
+        deadline = self._loop.time() + settings.RABBITMQ_PUBLISH_LINGER_MS / 1000
+        while len(batch) < settings.RABBITMQ_PUBLISH_BATCH_SIZE:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._buffer.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return coalesce_messages(batch, settings.RABBITMQ_PUBLISH_BATCH_SIZE)
+
+    async def _run_publisher(self) -> None:
+        messages = []
+        while True:
+            if not messages:
+                messages = await self._next_batch()
+            try:
+                while messages:
+                    routing_key, payload = messages[0]
+                    body, content_type, content_encoding = wire.encode(routing_key, payload)
+                    headers = {'x-wire-version': wire.WIRE_VERSION}
+                    if routing_key == 'transactions':
+                        headers['batch_size'] = len(payload)
+                    exchange, queue_key = destination(routing_key)
+                    await self._exchanges[exchange].publish(
+                        aio_pika.Message(
+                            body=body,
+                            content_type=content_type,
+                            content_encoding=content_encoding,
+                            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                            headers=headers
+                        ),
+                        routing_key=queue_key
+                    )
+                    messages.pop(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # connect_robust restablece la conexión; se reintenta el lote pendiente
+                print(f"⚠️  Error publicando en RabbitMQ (asyncio), reintentando: {e}")
+                await asyncio.sleep(1)
+
+    async def flush(self, timeout: float = 5.0) -> bool:
+        """Espera a que el buffer de publicación se vacíe"""
+        try:
+            await asyncio.wait_for(self._wait_empty(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _wait_empty(self) -> None:
+        while self._buffer is not None and not self._buffer.empty():
+            await asyncio.sleep(0.01)
+
+    def publish_transaction(self, transaction: Transaction) -> bool:
+        return self.publish_transactions([transaction])
+
+    def publish_transactions(self, transactions: List[Transaction]) -> bool:
+        if not transactions:
+            return True
+        return self._enqueue('transactions', list(transactions))
+
+    def publish_block(self, block: Block, balance_deltas: Optional[Dict[str, int]] = None) -> bool:
+        """Publica el evento del bloque (cabecera + variación de balances por dirección)"""
+        return self._enqueue('blocks', wire.block_event(block, balance_deltas))
+
+    def publish_mining_request(self, mining_address: str) -> bool:
+        return self._enqueue('mining', {'mining_address': mining_address})
+
+    def publish_task_event(self, task_id: str, task_name: str, state: str) -> bool:
+        return self._enqueue('tasks', {'task_id': task_id, 'task_name': task_name, 'state': state})
+
+    # ==================== Consumo ====================
+
+    async def consume_blocks(self, callback: Callable[[dict], Awaitable[None]], shared: bool = False) -> None:
+        """
+        Consume los eventos de bloque sobre el event loop y espera el callback
+        (corutina que recibe el evento del bloque) por cada mensaje.
+        """
+        await self._consume_fanout(settings.BLOCK_EVENTS_EXCHANGE, callback, shared)
+
+    async def consume_task_events(self, callback: Callable[[dict], Awaitable[None]], shared: bool = False) -> None:
+        """Consume los eventos de finalización de tareas Celery"""
+        await self._consume_fanout(settings.TASK_EVENTS_EXCHANGE, callback, shared)
+
+    async def _consume_fanout(self, exchange_name: str, callback: Callable[[dict], Awaitable[None]],
+                              shared: bool = False) -> None:
+        """
+        Por defecto cada réplica de la API enlaza su propia cola exclusiva al
+        exchange fanout, de modo que todas reciben todos los eventos. Con
+        shared=True las réplicas compiten por una cola durable común y cada
+        evento lo procesa una sola (el backplane de WebSocket lo reparte).
+        Los acks se agrupan: cada BLOCK_EVENTS_ACK_BATCH mensajes o cada
+        BLOCK_EVENTS_ACK_INTERVAL_MS, lo que ocurra primero.
+        """
+        channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=settings.BLOCK_EVENTS_PREFETCH)
+        exchange = await self._declare_fanout_exchange(channel, exchange_name)
+        if shared:
+            queue = await channel.declare_queue(f"{exchange_name}.ws", durable=True)
+        else:
+            queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+        await queue.bind(exchange)
+
+        unacked: Dict[str, object] = {'message': None, 'count': 0}
+
+        async def flush_acks():
+            message = unacked['message']
+            if message is not None:
+                unacked['message'] = None
+                unacked['count'] = 0
+                await message.ack(multiple=True)
+
+        async def flush_periodically():
+            while True:
+                await asyncio.sleep(settings.BLOCK_EVENTS_ACK_INTERVAL_MS / 1000)
+                try:
+                    await flush_acks()
+                except Exception as e:
+                    print(f"⚠️  Error confirmando eventos de {exchange_name} en RabbitMQ: {e}")
+
+        flusher = asyncio.create_task(flush_periodically())
+        try:
+            async with queue.iterator() as messages:
+                async for message in messages:
+                    try:
+                        await callback(wire.decode(message.body, message.content_type, message.content_encoding))
+                        unacked['message'] = message
+                        unacked['count'] += 1
+                        if unacked['count'] >= settings.BLOCK_EVENTS_ACK_BATCH:
+                            await flush_acks()
+                    except Exception as e:
+                        print(f"Error procesando evento de {exchange_name} desde RabbitMQ: {e}")
+                        await flush_acks()
+                        await message.nack(requeue=False)
+        finally:
+            flusher.cancel()
+
+    async def close(self):
+        """Vacía el buffer de publicación y cierra la conexión"""
+        if self._publisher_task is not None:
+            await self.flush()
+            self._publisher_task.cancel()
+        if self.connection is not None and not self.connection.is_closed:
+            await self.connection.close()
+
+
+async_rabbitmq_client = AsyncRabbitMQClient()
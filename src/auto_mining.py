@@ -0,0 +1,67 @@
+from src.config import settings
+from src.redis_client import redis_client
+
+
+# Marcas de "minado automático ya programado" (evitan encolar tareas duplicadas)
+AUTO_MINE_NOW_KEY = 'automine:now'
+AUTO_MINE_DEFERRED_KEY = 'automine:deferred'
+
+
+class AutoMiningTrigger:
+    """
+    Minado automático dirigido por eventos del mempool:
+    - se mina de inmediato cuando el mempool alcanza AUTO_MINE_MAX_PENDING
+      transacciones (bloques llenos con carga alta);
+    - la primera transacción que entra en un mempool vacío programa un minado
+      diferido AUTO_MINE_MAX_AGE segundos después (latencia acotada con poca
+      carga).
+    La tarea periódica de Celery beat queda solo como respaldo.
+    """
+
+    def _schedule(self, key: str, countdown: float) -> None:
+        try:
+            if redis_client.client is None:
+                redis_client.initialize()
+            # La marca caduca sola si la tarea se pierde
+            if not redis_client.client.set(key, '1', nx=True, ex=int(countdown) + 60):
+                return
+            # Import diferido: src.tasks importa el servicio de blockchain
+            from src.celery_app import celery_app
+            celery_app.send_task('src.tasks.auto_mine_task', countdown=countdown)
+        except Exception as e:
+            print(f"⚠️  No se pudo programar el minado automático: {e}")
+
+    def on_transactions_added(self, previous_count: int, new_count: int) -> None:
+        if not settings.AUTO_MINE_ENABLED or new_count <= previous_count:
+            return
+        if 0 < settings.AUTO_MINE_MAX_PENDING <= new_count:
+            self._schedule(AUTO_MINE_NOW_KEY, 0)
+        elif previous_count == 0:
+            self._schedule(AUTO_MINE_DEFERRED_KEY, settings.AUTO_MINE_MAX_AGE)
+
+    def reset(self) -> None:
+        """Permite volver a programar el minado automático"""
+        try:
+            if redis_client.client is None:
+                redis_client.initialize()
+            redis_client.client.delete(AUTO_MINE_NOW_KEY, AUTO_MINE_DEFERRED_KEY)
+        except Exception as e:
+            print(f"⚠️  No se pudieron limpiar las marcas de minado automático: {e}")
+
+    def on_block_mined(self) -> None:
+        """Tras confirmar un bloque: permite nuevas programaciones y atiende lo que quedó pendiente"""
+        if not settings.AUTO_MINE_ENABLED:
+            return
+        self.reset()
+        try:
+            remaining = redis_client.get_mempool_usage()[0]
+        except Exception as e:
+            print(f"⚠️  No se pudo consultar el mempool tras minar: {e}")
+            return
+        if 0 < settings.AUTO_MINE_MAX_PENDING <= remaining:
+            self._schedule(AUTO_MINE_NOW_KEY, 0)
+        elif remaining > 0:
+            self._schedule(AUTO_MINE_DEFERRED_KEY, settings.AUTO_MINE_MAX_AGE)
+
+
+auto_mining_trigger = AutoMiningTrigger()
@@ -0,0 +1,75 @@
+from src.database import db
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+
+
+class BalanceTracker:
+    """
+    Balances en memoria de las direcciones suscritas por WebSocket.
+    Cada dirección se carga una vez desde address_balances (junto con la altura
+    de la instantánea) y después se actualiza con el balance_deltas de cada
+    evento de bloque, sin recorrer la cadena. Si se detecta un hueco en los
+    índices de bloque (p. ej. tras una reconexión) el mapa se descarta y se
+    vuelve a cargar bajo demanda.
+    """
+
+    def __init__(self) -> None:
+        # dirección -> (balance en wei, índice del último bloque aplicado)
+        self._balances: Dict[str, Tuple[int, int]] = {}
+        self._last_index: Optional[int] = None
+
+    async def _seed(self, addresses: Iterable[str]) -> None:
+        addresses = [address for address in addresses if address not in self._balances]
+        if not addresses:
+            return
+        height, balances = await asyncio.to_thread(db.get_balances_snapshot, addresses)
+        for address, balance in balances.items():
+            self._balances[address] = (balance, height)
+
+    async def apply_block(self, block_data: dict, subscribed: Iterable[str]) -> Dict[str, int]:
+        """
+        Aplica el evento de bloque a las direcciones suscritas afectadas.
+        Retorna {dirección: balance actualizado en wei}
+        """
+        index = block_data.get("index")
+        if self._last_index is not None and index is not None and index > self._last_index + 1:
+            print(f"⚠️  Hueco en eventos de bloque ({self._last_index} -> {index}); recargando balances")
+            self._balances.clear()
+        if index is not None and (self._last_index is None or index > self._last_index):
+            self._last_index = index
+
+        deltas = {address.lower(): int(delta) for address, delta in block_data.get("balance_deltas", {}).items()}
+        affected = set(deltas) & {address.lower() for address in subscribed}
+        affected.discard("")
+        affected.discard("sistema")
+        if not affected:
+            return {}
+
+        await self._seed(affected)
+        updated = {}
+        for address in affected:
+            balance, height = self._balances[address]
+            # La instantánea inicial puede incluir ya este bloque
+            if index is None or height < index:
+                balance += deltas[address]
+                self._balances[address] = (balance, index if index is not None else height)
+            updated[address] = balance
+        return updated
+
+    async def fetch(self, addresses: Iterable[str]) -> Dict[str, int]:
+        """
+        Balances confirmados leídos directamente de address_balances, sin caché.
+        Se usa con el backplane de WebSocket, donde cada réplica procesa solo
+        una parte de los bloques y no puede mantener el mapa incremental.
+        """
+        addresses = [address for address in addresses if address not in ("", "sistema")]
+        if not addresses:
+            return {}
+        return await asyncio.to_thread(db.get_balances, addresses)
+
+    def forget(self, address: str) -> None:
+        """Descarta el balance de una dirección sin suscriptores"""
+        self._balances.pop(address.lower(), None)
+
+
+balance_tracker = BalanceTracker()
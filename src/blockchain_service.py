@@ -4,12 +4,26 @@ from src.redis_client import redis_client
 from src.rabbitmq_client import rabbitmq_client
 from src.config import settings
 from src.genesis import genesis_loader
+from src.admission import admission_controller, AdmissionError, RateLimitError
+from src.locks import LeaseLock
+from src.auto_mining import auto_mining_trigger
 from typing import List, Optional, Dict
+import json
+import threading
+
+
+# Lease del productor de bloques (un solo minero por punta de la cadena)
+BLOCK_PRODUCER_LOCK = 'lock:block_producer'
 
 
 class BlockchainService:
     def __init__(self):
         self.blockchain = None
+        # Serializa los cambios de la cadena en memoria: la API la sincroniza
+        # desde el event loop y desde el threadpool (p. ej. /mine) a la vez
+        self._chain_lock = threading.RLock()
+        # Publicador de eventos (la API lo reemplaza por el cliente asyncio)
+        self.publisher = rabbitmq_client
         self._initialize_blockchain()
     
     def _initialize_blockchain(self):
@@ -80,63 +94,190 @@ class BlockchainService:
                 mining_reward=settings.BLOCKCHAIN_MINING_REWARD
             )
     
-    def add_transaction(self, sender: str, recipient: str, amount: float) -> bool:
+    @staticmethod
+    def _build_transaction(sender: str, recipient: str, amount) -> Transaction:
+        """Valida los datos de una transacción y construye el objeto (amount se convierte a wei)"""
+        from src.utils import parse_amount
+        if not sender or not isinstance(sender, str):
+            raise ValueError("El remitente es obligatorio")
+        if not recipient or not isinstance(recipient, str):
+            raise ValueError("El destinatario es obligatorio")
         try:
-            from src.utils import parse_amount
-            # amount puede venir como float (ej: 1.5) y se convierte a wei (entero)
             amount_wei = parse_amount(amount)
-            transaction = Transaction(
-                sender=sender,
-                recipient=recipient,
-                amount=amount_wei
-            )
-            self.blockchain.add_transaction(transaction)
-            redis_client.cache_pending_transactions(self.blockchain.pending_transactions)
-            rabbitmq_client.publish_transaction(transaction)
-            return True
+        except Exception:
+            raise ValueError(f"Monto inválido: {amount}")
+        if amount_wei <= 0:
+            raise ValueError("El monto debe ser mayor a 0")
+        return Transaction(sender=sender, recipient=recipient, amount=amount_wei)
+    
+    def add_transaction(self, sender: str, recipient: str, amount: float) -> bool:
+        try:
+            result = self.add_transactions_batch([
+                {'sender': sender, 'recipient': recipient, 'amount': amount}
+            ])[0]
+            if not result['success']:
+                print(f"Error agregando transacción: {result.get('error')}")
+            return result['success']
+        except AdmissionError:
+            raise
         except Exception as e:
             print(f"Error agregando transacción: {e}")
             return False
     
+    def add_transactions_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        Agrega un lote de transacciones al mempool.
+        Valida todos los elementos, aplica el control de admisión y el chequeo
+        de saldo (balance confirmado menos salidas pendientes), agrega los
+        válidos a Redis en una sola operación y los publica en RabbitMQ en un
+        único mensaje. Retorna un resultado por elemento, en el mismo orden
+        que la entrada.
+        Lanza MempoolFullError si el mempool está lleno, RateLimitError si
+        ninguna transacción válida cabe en la cuota de su remitente y
+        RuntimeError si no se pudo escribir en Redis.
+        """
+        results = []
+        valid = []
+        for item in items:
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Formato de transacción inválido")
+                transaction = self._build_transaction(
+                    item.get('sender'),
+                    item.get('recipient'),
+                    item.get('amount')
+                )
+                results.append({'success': True, 'transaction': item})
+                valid.append((results[-1], transaction))
+            except Exception as e:
+                results.append({'success': False, 'transaction': item, 'error': str(e)})
+        
+        if not valid:
+            return results
+        
+        payloads = [json.dumps(tx.to_dict()) for _, tx in valid]
+        admission_controller.check_mempool_capacity(len(payloads), sum(len(p) for p in payloads))
+        
+        requested = {}
+        for _, tx in valid:
+            requested[tx.sender.lower()] = requested.get(tx.sender.lower(), 0) + 1
+        quotas = {sender: list(quota) for sender, quota in admission_controller.consume_sender_quotas(requested).items()}
+        
+        admitted = []
+        retry_after = 0
+        for (result, tx), payload in zip(valid, payloads):
+            quota = quotas[tx.sender.lower()]
+            if quota[0] > 0:
+                quota[0] -= 1
+                admitted.append((result, tx, payload))
+            else:
+                result['success'] = False
+                result['error'] = 'Cuota de transacciones del remitente excedida'
+                result['retry_after'] = quota[1]
+                retry_after = max(retry_after, quota[1])
+        
+        if not admitted:
+            raise RateLimitError('Cuota de transacciones del remitente excedida', retry_after)
+        
+        if redis_client.client is None:
+            redis_client.initialize()
+        entries = [(tx.sender.lower(), tx.amount, payload) for _, tx, payload in admitted]
+        # Balance confirmado (con la altura de la cadena en la misma instantánea)
+        # desde la tabla incremental, leído dentro del WATCH de las salidas
+        # pendientes, que se descuentan de forma atómica al agregar
+        load_spendable = db.get_balances_snapshot if settings.ENFORCE_BALANCE_CHECK else None
+        appended = redis_client.append_pending_transactions(entries, load_spendable)
+        if appended is None:
+            raise RuntimeError('Error agregando transacciones al mempool')
+        
+        new_length, accepted_flags = appended
+        accepted_count = sum(1 for accepted in accepted_flags if accepted)
+        auto_mining_trigger.on_transactions_added(new_length - accepted_count, new_length)
+        
+        published = []
+        for (result, tx, _), accepted in zip(admitted, accepted_flags):
+            if accepted:
+                result['hash'] = tx.calculate_hash()
+                published.append(tx)
+            else:
+                result['success'] = False
+                result['error'] = 'Saldo insuficiente (considerando transacciones pendientes)'
+        self.publisher.publish_transactions(published)
+        return results
+    
     def mine_pending_transactions(self, mining_reward_address: str = None, include_reward: bool = True) -> Optional[Block]:
         """
         Mina las transacciones pendientes
         - mining_reward_address: Dirección que recibe la recompensa (opcional)
         - include_reward: Si True, agrega recompensa de minería. Si False, mina sin recompensa
+        Un solo productor de bloques a la vez (lease en Redis con token de
+        cercado): lanza LockNotAcquired si otro minero está trabajando.
         """
+        lock = LeaseLock(BLOCK_PRODUCER_LOCK, settings.BLOCK_PRODUCER_LOCK_TTL_MS, min_token=db.get_fencing_token())
+        with lock:
+            # El token se registra al tomar el lease: el propietario anterior
+            # (lease expirado) queda cercado aunque este minero aún no guarde nada
+            if not db.advance_fencing_token(lock.token):
+                print(f"⚠️  Lease del productor obsoleto (token {lock.token})")
+                return None
+            return self._mine_with_lease(mining_reward_address, include_reward, lock)
+    
+    def _mine_with_lease(self, mining_reward_address: Optional[str], include_reward: bool,
+                         lock: LeaseLock) -> Optional[Block]:
         try:
-            # Asegurar que tenemos las transacciones pendientes más recientes desde Redis
+            # Construir sobre la punta actual de la cadena (otro worker pudo minar)
+            self.get_chain()
+            # Bajo el lease, el bloque se arma siempre con la instantánea actual del
+            # mempool en Redis (aunque esté vacía): la lista en memoria pudo quedar
+            # de una consulta anterior y contener transacciones ya confirmadas
             try:
                 if redis_client.client is None:
                     redis_client.initialize()
                 pending_tx_data = redis_client.get_pending_transactions()
-                if pending_tx_data:
-                    from src.models import Transaction
-                    from datetime import datetime
-                    # Sincronizar transacciones pendientes desde Redis
-                    self.blockchain.pending_transactions = []
-                    for tx_dict in pending_tx_data:
-                        tx = Transaction(
-                            sender=tx_dict.get('sender', ''),
-                            recipient=tx_dict.get('recipient', ''),
-                            amount=int(tx_dict.get('amount', 0)),
-                            timestamp=datetime.fromisoformat(tx_dict.get('timestamp', datetime.now().isoformat())) if isinstance(tx_dict.get('timestamp'), str) else tx_dict.get('timestamp', datetime.now())
-                        )
-                        self.blockchain.pending_transactions.append(tx)
             except Exception as e:
-                print(f"⚠️  Advertencia al sincronizar transacciones pendientes: {e}")
+                print(f"⚠️  No se pudo leer el mempool desde Redis: {e}")
+                return None
             
-            self.blockchain.mine_pending_transactions(mining_reward_address, include_reward=include_reward)
-            latest_block = self.blockchain.get_latest_block()
+            from datetime import datetime
+            pending_transactions = [
+                Transaction(
+                    sender=tx_dict.get('sender', ''),
+                    recipient=tx_dict.get('recipient', ''),
+                    amount=int(tx_dict.get('amount', 0)),
+                    timestamp=datetime.fromisoformat(tx_dict.get('timestamp', datetime.now().isoformat())) if isinstance(tx_dict.get('timestamp'), str) else tx_dict.get('timestamp', datetime.now())
+                )
+                for tx_dict in pending_tx_data or []
+            ]
             
-            if db.save_block(latest_block):
-                # Limpiar transacciones pendientes en Redis después de minar
-                redis_client.cache_pending_transactions([])
+            mined_count = len(pending_tx_data or [])
+            if mined_count == 0 and not (include_reward and mining_reward_address):
+                # Otro minero confirmó las transacciones mientras se esperaba el lease
+                return None
+            with self._chain_lock:
+                previous = self.blockchain.get_latest_block()
+            # La prueba de trabajo se hace fuera del lock y sin tocar la cadena en
+            # memoria: el bloque se incorpora al sincronizar después de guardarlo
+            latest_block = self.blockchain.create_block(
+                pending_transactions, previous, mining_reward_address, include_reward=include_reward
+            )
+            
+            # Variación de balances calculada una sola vez: la usan la BD y el evento del bloque
+            balance_deltas = latest_block.balance_deltas()
+            if lock.lost:
+                # El lease expiró durante la minería: otro productor puede estar activo
+                print(f"⚠️  Bloque #{latest_block.index} descartado: lease perdido (token {lock.token})")
+                return None
+            if db.save_block(latest_block, balance_deltas, lock.token):
+                # Quitar del mempool solo las transacciones minadas; las que
+                # llegaron durante la minería siguen pendientes
+                redis_client.remove_pending_transactions(mined_count, latest_block.index)
                 redis_client.cache_blockchain_state(
-                    len(self.blockchain.chain),
+                    latest_block.index + 1,
                     latest_block.hash
                 )
-                rabbitmq_client.publish_block(latest_block)
+                self.get_chain()
+                self.publisher.publish_block(latest_block, balance_deltas)
+                auto_mining_trigger.on_block_mined()
                 return latest_block
             return None
         except Exception as e:
@@ -146,18 +287,35 @@ class BlockchainService:
     def get_balance(self, address: str) -> int:
         """Retorna el balance en wei (entero sin decimales)"""
         # Asegurar que tenemos la cadena más reciente antes de calcular el balance
-        self.get_chain()  # Recarga desde BD
+        self.get_chain()  # Sincroniza desde BD
         return self.blockchain.get_balance(address)
     
     def get_chain(self) -> List[Block]:
-        # Recargar desde BD para asegurar que tenemos la versión más reciente
+        # Sincronizar con la BD para asegurar que tenemos la versión más reciente
         try:
+            with self._chain_lock:
+                self._sync_chain()
+        except Exception as e:
+            print(f"⚠️  Advertencia al sincronizar cadena desde BD: {e}")
+        return self.blockchain.chain
+    
+    def _sync_chain(self) -> None:
+        """
+        Agrega solo los bloques nuevos desde la BD. Si la punta local ya no
+        coincide con la de la BD (p. ej. un bloque minado localmente que no se
+        pudo guardar) se recarga la cadena completa.
+        """
+        chain = self.blockchain.chain
+        tip = chain[-1] if chain else None
+        if tip is None or db.get_block_hash(tip.index) != tip.hash:
             blocks = db.get_all_blocks()
             if blocks:
                 self.blockchain.chain = blocks
-        except Exception as e:
-            print(f"⚠️  Advertencia al recargar cadena desde BD: {e}")
-        return self.blockchain.chain
+            return
+        # Solo bloques que continúan la cadena local (nunca duplicados)
+        for block in db.get_blocks_since(tip.index):
+            if block.index == len(chain) and block.previous_hash == chain[-1].hash:
+                chain.append(block)
     
     def get_pending_transactions(self) -> List[Transaction]:
         # SIEMPRE sincronizar con Redis antes de devolver (fuente de verdad)
@@ -206,128 +364,113 @@ class BlockchainService:
         return None
     
     def is_chain_valid(self) -> bool:
-        return self.blockchain.is_chain_valid()
+        return self.validate_chain()['is_valid']
+    
+    def validate_chain(self, full: bool = False) -> dict:
+        """
+        Valida la cadena a partir del último checkpoint (altura y hash de la
+        punta verificada, guardados en Redis): solo se verifican los bloques
+        agregados desde entonces. Si la punta del checkpoint ya no coincide
+        con la cadena, o con full=True, se valida desde el génesis.
+        Retorna {is_valid, height, tip_hash, invalid_index, validated_from}
+        """
+        chain = self.get_chain()
+        start = 1
+        checkpoint = None if full else redis_client.get_validation_checkpoint()
+        if checkpoint:
+            height = checkpoint.get('height', -1)
+            if 0 <= height < len(chain) and chain[height].hash == checkpoint.get('tip_hash'):
+                if not checkpoint.get('is_valid'):
+                    # Un bloque ya verificado era inválido: sigue siéndolo
+                    return dict(checkpoint, validated_from=None)
+                start = height + 1
+        
+        invalid_index = self.blockchain.find_invalid_block(start)
+        # El checkpoint avanza hasta el último bloque verificado como válido
+        height = len(chain) - 1 if invalid_index is None else invalid_index
+        result = {
+            'is_valid': invalid_index is None,
+            'height': height,
+            'tip_hash': chain[height].hash if chain else None,
+            'invalid_index': invalid_index
+        }
+        if chain:
+            redis_client.cache_validation_checkpoint(result)
+        return dict(result, validated_from=start)
     
     def get_chain_info(self) -> dict:
         # Sincronizar antes de devolver info
-        chain = self.get_chain()  # Recarga desde BD
-        pending = self.get_pending_transactions()  # Sincroniza desde Redis
+        chain = self.get_chain()  # Sincroniza desde BD
+        if redis_client.client is None:
+            redis_client.initialize()
+        pending_count, _ = redis_client.get_mempool_usage()
+        # Validación incremental: solo los bloques nuevos desde el último checkpoint
+        validation = self.validate_chain()
         return {
             'length': len(chain),
             'difficulty': self.blockchain.difficulty,
             'mining_reward': self.blockchain.mining_reward,
-            'pending_transactions': len(pending),
-            'is_valid': self.is_chain_valid()
+            'pending_transactions': pending_count,
+            'is_valid': validation['is_valid'],
+            'validated_height': validation['height']
         }
     
     def get_financial_report(self) -> dict:
         """
-        Genera un reporte financiero completo de la blockchain
+        Genera un reporte financiero completo de la blockchain a partir de los
+        agregados que se actualizan al guardar cada bloque (sin recorrer la cadena)
         """
-        from src.utils import format_amount, from_wei
-        from collections import defaultdict
+        from src.utils import format_amount
         from datetime import datetime, timedelta
         
-        chain = self.get_chain()  # Recargar desde BD
+        aggregates = db.get_financial_aggregates(top=10, recent=10, days=7)
+        summary = aggregates['summary']
+        total_blocks = summary['total_blocks']
+        total_transactions = summary['total_transactions']
         
-        # Estadísticas generales
-        total_blocks = len(chain)
-        total_transactions = sum(len(block.transactions) for block in chain)
-        
-        # Calcular volumen total transaccionado
-        total_volume_wei = 0
-        total_rewards_wei = 0
-        unique_addresses = set()
-        address_balances = defaultdict(int)
-        transactions_by_day = defaultdict(int)
-        volume_by_day = defaultdict(int)
-        
-        # Procesar todos los bloques
-        for block in chain:
-            block_date = block.timestamp.date() if isinstance(block.timestamp, datetime) else block.timestamp
-            if isinstance(block_date, str):
-                try:
-                    block_date = datetime.fromisoformat(block_date).date()
-                except:
-                    block_date = datetime.now().date()
-            
-            for tx in block.transactions:
-                # Contar direcciones únicas
-                if tx.sender and tx.sender != "Sistema":
-                    unique_addresses.add(tx.sender.lower())
-                if tx.recipient:
-                    unique_addresses.add(tx.recipient.lower())
-                
-                # Calcular volumen (solo transacciones entre direcciones, no recompensas)
-                if tx.sender != "Sistema":
-                    total_volume_wei += tx.amount
-                    volume_by_day[block_date] += tx.amount
-                else:
-                    total_rewards_wei += tx.amount
-                
-                # Contar transacciones por día
-                transactions_by_day[block_date] += 1
-                
-                # Calcular balances
-                if tx.sender and tx.sender != "Sistema":
-                    address_balances[tx.sender.lower()] -= tx.amount
-                if tx.recipient:
-                    address_balances[tx.recipient.lower()] += tx.amount
-        
-        # Top direcciones por balance
-        top_addresses = sorted(
-            [(addr, balance) for addr, balance in address_balances.items() if balance > 0],
-            key=lambda x: x[1],
-            reverse=True
-        )[:10]
-        
-        # Estadísticas de minería
-        mining_rewards_count = sum(
-            1 for block in chain
-            for tx in block.transactions
-            if tx.sender == "Sistema"
-        )
-        
-        # Últimas transacciones (últimas 10)
+        # Últimas transacciones (últimas 10 de los últimos 5 bloques)
         recent_transactions = []
-        for block in reversed(chain[-5:]):  # Últimos 5 bloques
-            for tx in block.transactions:
-                recent_transactions.append({
-                    'hash': tx.calculate_hash(),
-                    'sender': tx.sender,
-                    'recipient': tx.recipient,
-                    'amount': tx.amount,
-                    'amount_formatted': format_amount(tx.amount),
-                    'block_index': block.index,
-                    'timestamp': block.timestamp.isoformat() if isinstance(block.timestamp, datetime) else str(block.timestamp)
-                })
-                if len(recent_transactions) >= 10:
-                    break
-            if len(recent_transactions) >= 10:
-                break
+        for tx in aggregates['recent_transactions']:
+            transaction = Transaction(
+                sender=tx['sender'],
+                recipient=tx['recipient'],
+                amount=int(tx['amount']),
+                timestamp=tx['tx_timestamp']
+            )
+            block_timestamp = tx['block_timestamp']
+            recent_transactions.append({
+                'hash': transaction.calculate_hash(),
+                'sender': transaction.sender,
+                'recipient': transaction.recipient,
+                'amount': transaction.amount,
+                'amount_formatted': format_amount(transaction.amount),
+                'block_index': tx['block_index'],
+                'timestamp': block_timestamp.isoformat() if isinstance(block_timestamp, datetime) else str(block_timestamp)
+            })
         
         # Estadísticas por período (últimos 7 días)
         last_7_days = []
         today = datetime.now().date()
         for i in range(7):
             date = today - timedelta(days=i)
+            transactions, volume = aggregates['daily'].get(date, (0, 0))
             last_7_days.append({
                 'date': date.isoformat(),
-                'transactions': transactions_by_day.get(date, 0),
-                'volume': volume_by_day.get(date, 0),
-                'volume_formatted': format_amount(volume_by_day.get(date, 0))
+                'transactions': transactions,
+                'volume': volume,
+                'volume_formatted': format_amount(volume)
             })
         
         return {
             'summary': {
                 'total_blocks': total_blocks,
                 'total_transactions': total_transactions,
-                'total_volume_wei': total_volume_wei,
-                'total_volume_formatted': format_amount(total_volume_wei),
-                'total_rewards_wei': total_rewards_wei,
-                'total_rewards_formatted': format_amount(total_rewards_wei),
-                'unique_addresses': len(unique_addresses),
-                'mining_rewards_count': mining_rewards_count,
+                'total_volume_wei': summary['total_volume'],
+                'total_volume_formatted': format_amount(summary['total_volume']),
+                'total_rewards_wei': summary['total_rewards'],
+                'total_rewards_formatted': format_amount(summary['total_rewards']),
+                'unique_addresses': summary['unique_addresses'],
+                'mining_rewards_count': summary['mining_rewards_count'],
                 'average_transactions_per_block': round(total_transactions / total_blocks, 2) if total_blocks > 0 else 0
             },
             'top_addresses': [
@@ -336,22 +479,66 @@ class BlockchainService:
                     'balance': balance,
                     'balance_formatted': format_amount(balance)
                 }
-                for addr, balance in top_addresses
+                for addr, balance in aggregates['top_addresses']
             ],
             'recent_transactions': recent_transactions,
             'daily_statistics': last_7_days,
             'generated_at': datetime.now().isoformat()
         }
+    
+    def get_volume_timeseries(self, start, end, granularity: str = 'day') -> dict:
+        """
+        Serie temporal de transacciones y volumen para dashboards, leída de las
+        tablas de agregados por hora o por día. El intervalo se amplía a
+        periodos completos; los periodos sin actividad no se incluyen.
+        """
+        from src.utils import format_amount
+        from datetime import timedelta
+        
+        step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+        if granularity == 'hour':
+            aligned_start = start.replace(minute=0, second=0, microsecond=0)
+        else:
+            aligned_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        aligned_end = aligned_start + ((end - aligned_start) + step - timedelta(microseconds=1)) // step * step
+        
+        timeseries = db.get_volume_timeseries(aligned_start, aligned_end, granularity)
+        total_transactions = sum(transactions for _, transactions, _ in timeseries['points'])
+        total_volume = sum(volume for _, _, volume in timeseries['points'])
+        return {
+            'granularity': granularity,
+            'start': aligned_start.isoformat(),
+            'end': aligned_end.isoformat(),
+            'points': [
+                {
+                    'period': period.isoformat(),
+                    'transactions': transactions,
+                    'volume': volume,
+                    'volume_formatted': format_amount(volume)
+                }
+                for period, transactions, volume in timeseries['points']
+            ],
+            'totals': {
+                'blocks': timeseries['blocks'],
+                'transactions': total_transactions,
+                'volume': total_volume,
+                'volume_formatted': format_amount(total_volume)
+            }
+        }
 
 
 # Instancia global que se inicializará cuando se necesite
 _blockchain_service_instance = None
+# Evita que varios hilos (API, worker con pool de hilos) carguen la cadena a la vez
+_blockchain_service_lock = threading.Lock()
 
 def get_blockchain_service() -> BlockchainService:
     """Obtiene la instancia del servicio de blockchain, inicializándola si es necesario"""
     global _blockchain_service_instance
     if _blockchain_service_instance is None:
-        _blockchain_service_instance = BlockchainService()
+        with _blockchain_service_lock:
+            if _blockchain_service_instance is None:
+                _blockchain_service_instance = BlockchainService()
     return _blockchain_service_instance
 
 # Para compatibilidad con el código existente, crear una instancia después de inicializar servicios
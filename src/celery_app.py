@@ -1,6 +1,10 @@
 from celery import Celery
+from kombu import Exchange, Queue
 from src.config import settings
 
+# Prioridad máxima de las colas de tareas (0-9; 9 es la más urgente)
+MAX_TASK_PRIORITY = 9
+
 # Configurar Celery usando RabbitMQ como broker y Redis como backend
 celery_app = Celery(
     'blockchain_tasks',
@@ -19,27 +23,50 @@ celery_app.conf.update(
     task_time_limit=300,  # 5 minutos máximo por tarea
     task_soft_time_limit=240,  # 4 minutos soft limit
     worker_prefetch_multiplier=1,
-    worker_max_tasks_per_child=50,
+    # Los workers mantienen la cadena en memoria; reciclarlos obliga a recargarla
+    worker_max_tasks_per_child=settings.CELERY_MAX_TASKS_PER_CHILD or None,
     task_acks_late=True,
     task_reject_on_worker_lost=True,
     result_expires=3600,  # Los resultados expiran en 1 hora
     broker_connection_retry_on_startup=True,  # Retry de conexión al inicio
+    # Carriles por clase de tarea, cada uno en colas con prioridad de RabbitMQ.
+    # Son colas propias de Celery: 'transactions' y 'mining' transportan los
+    # mensajes de eventos de src/rabbitmq_client.py
+    task_queues=(
+        Queue('ingest', Exchange('ingest'), routing_key='ingest',
+              queue_arguments={'x-max-priority': MAX_TASK_PRIORITY}),
+        Queue('block_production', Exchange('block_production'), routing_key='block_production',
+              queue_arguments={'x-max-priority': MAX_TASK_PRIORITY}),
+        Queue('maintenance', Exchange('maintenance'), routing_key='maintenance',
+              queue_arguments={'x-max-priority': MAX_TASK_PRIORITY}),
+        Queue('default', Exchange('default'), routing_key='default'),
+    ),
+    task_queue_max_priority=MAX_TASK_PRIORITY,
+    task_default_priority=5,
     task_routes={
-        'src.tasks.mine_block_task': {'queue': 'mining'},
-        'src.tasks.auto_mine_task': {'queue': 'auto_mining'},
-        'src.tasks.process_transaction_task': {'queue': 'transactions'},
-        'src.tasks.validate_chain_task': {'queue': 'validation'},
-        'src.tasks.update_cache_task': {'queue': 'cache'},
+        'src.tasks.mine_block_task': {'queue': 'block_production'},
+        'src.tasks.auto_mine_task': {'queue': 'block_production'},
+        'src.tasks.process_transaction_task': {'queue': 'ingest'},
+        'src.tasks.batch_process_transactions_task': {'queue': 'ingest'},
+        'src.tasks.process_transaction_chunk_task': {'queue': 'ingest'},
+        'src.tasks.aggregate_batch_results_task': {'queue': 'ingest'},
+        'src.tasks.validate_chain_task': {'queue': 'maintenance'},
+        'src.tasks.validate_block_range_task': {'queue': 'maintenance'},
+        'src.tasks.aggregate_chain_validation_task': {'queue': 'maintenance'},
+        'src.tasks.update_cache_task': {'queue': 'maintenance'},
     },
     task_default_queue='default',
     task_default_exchange='default',
     task_default_exchange_type='direct',
     task_default_routing_key='default',
-    # Configuración de tareas periódicas (beat schedule)
+    # Configuración de tareas periódicas (beat schedule). El minado automático
+    # lo dispara el mempool (src/auto_mining.py); beat queda como respaldo
     beat_schedule={
-        'auto-mine-every-30-seconds': {
+        'auto-mine-fallback': {
             'task': 'src.tasks.auto_mine_task',
-            'schedule': 30.0,  # Cada 30 segundos
+            'schedule': float(settings.AUTO_MINE_FALLBACK_INTERVAL),
+            # Si ninguna instancia la tomó a tiempo se descarta en lugar de acumularse
+            'options': {'expires': settings.AUTO_MINE_FALLBACK_INTERVAL * 0.8},
         },
     },
 )
@@ -0,0 +1,105 @@
+"""
+Validación de la cadena por rangos de bloques.
+
+Cada rango verifica de forma independiente el hash de sus bloques y el enlace
+previous_hash entre bloques consecutivos del rango; los enlaces entre rangos
+(primer bloque de un rango con el último del anterior) se comprueban al
+combinar los resultados. Así los rangos pueden validarse en paralelo, en
+workers de Celery o en un pool de procesos.
+
+validate_stream valida en cambio un flujo de bloques (p. ej. db.iter_blocks)
+conservando solo el hash del bloque anterior, con memoria constante.
+"""
+from src.models import Block
+from typing import Dict, Iterable, List, Optional
+
+
+def validate_range(blocks: List[Block]) -> Dict:
+    """
+    Valida una lista de bloques consecutivos.
+    Retorna {start, end, first_invalid, first_previous_hash, last_hash};
+    end es exclusivo y first_invalid es None si el rango es válido.
+    """
+    if not blocks:
+        return {'start': None, 'end': None, 'first_invalid': None,
+                'first_previous_hash': None, 'last_hash': None}
+
+    first_invalid: Optional[int] = None
+    for position, block in enumerate(blocks):
+        # El bloque génesis no se recalcula (igual que Blockchain.is_chain_valid)
+        if block.index > 0 and block.hash != block.calculate_hash():
+            first_invalid = block.index
+            break
+        if position > 0 and block.previous_hash != blocks[position - 1].hash:
+            first_invalid = block.index
+            break
+        if position > 0 and block.index != blocks[position - 1].index + 1:
+            first_invalid = block.index
+            break
+
+    return {
+        'start': blocks[0].index,
+        'end': blocks[-1].index + 1,
+        'first_invalid': first_invalid,
+        'first_previous_hash': blocks[0].previous_hash,
+        'last_hash': blocks[-1].hash
+    }
+
+
+def merge_range_results(results: List[Dict]) -> Dict:
+    """
+    Combina los resultados de rangos contiguos y comprueba sus fronteras.
+    Retorna {is_valid, invalid_index, height, tip_hash, ranges}
+    """
+    results = sorted((r for r in results if r.get('start') is not None), key=lambda r: r['start'])
+    invalid_index: Optional[int] = None
+    for position, result in enumerate(results):
+        if position > 0:
+            previous = results[position - 1]
+            if result['start'] != previous['end'] or result['first_previous_hash'] != previous['last_hash']:
+                invalid_index = result['start']
+                break
+        if result['first_invalid'] is not None:
+            invalid_index = result['first_invalid']
+            break
+
+    if not results:
+        return {'is_valid': True, 'invalid_index': None, 'height': -1, 'tip_hash': None, 'ranges': 0}
+    if invalid_index is None:
+        height, tip_hash = results[-1]['end'] - 1, results[-1]['last_hash']
+    else:
+        height, tip_hash = invalid_index, None
+    return {
+        'is_valid': invalid_index is None,
+        'invalid_index': invalid_index,
+        'height': height,
+        'tip_hash': tip_hash,
+        'ranges': len(results)
+    }
+
+
+def validate_stream(blocks: Iterable[Block], previous_hash: Optional[str] = None) -> Dict:
+    """
+    Valida bloques consecutivos a medida que llegan, sin acumularlos.
+    previous_hash es el hash del bloque anterior al primero (None si el flujo
+    empieza en el génesis).
+    Retorna {is_valid, invalid_index, height, tip_hash, validated}
+    """
+    previous_index: Optional[int] = None
+    validated = 0
+    for block in blocks:
+        linked = previous_hash is None or block.previous_hash == previous_hash
+        consecutive = previous_index is None or block.index == previous_index + 1
+        if not linked or not consecutive or (block.index > 0 and block.hash != block.calculate_hash()):
+            return {'is_valid': False, 'invalid_index': block.index, 'height': block.index,
+                    'tip_hash': block.hash, 'validated': validated}
+        previous_hash, previous_index = block.hash, block.index
+        validated += 1
+    
+    return {
+        'is_valid': True,
+        'invalid_index': None,
+        'height': -1 if previous_index is None else previous_index,
+        'tip_hash': None if previous_index is None else previous_hash,
+        'validated': validated
+    }
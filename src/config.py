@@ -23,14 +23,66 @@ class Settings(BaseSettings):
     RABBITMQ_PORT: int = int(os.getenv("RABBITMQ_PORT", "5672"))
     RABBITMQ_USER: str = os.getenv("RABBITMQ_USER", "rabbitmq_user")
     RABBITMQ_PASSWORD: str = os.getenv("RABBITMQ_PASSWORD", "rabbitmq_pass")
+    RABBITMQ_PUBLISH_BUFFER: int = int(os.getenv("RABBITMQ_PUBLISH_BUFFER", "10000"))
+    RABBITMQ_PUBLISH_BATCH_SIZE: int = int(os.getenv("RABBITMQ_PUBLISH_BATCH_SIZE", "500"))
+    RABBITMQ_PUBLISH_LINGER_MS: int = int(os.getenv("RABBITMQ_PUBLISH_LINGER_MS", "20"))
+    # Eventos de bloque: exchange fanout con una cola exclusiva por réplica de la API
+    BLOCK_EVENTS_EXCHANGE: str = os.getenv("BLOCK_EVENTS_EXCHANGE", "blockchain.blocks")
+    BLOCK_EVENTS_PREFETCH: int = int(os.getenv("BLOCK_EVENTS_PREFETCH", "100"))
+    BLOCK_EVENTS_ACK_BATCH: int = int(os.getenv("BLOCK_EVENTS_ACK_BATCH", "20"))
+    BLOCK_EVENTS_ACK_INTERVAL_MS: int = int(os.getenv("BLOCK_EVENTS_ACK_INTERVAL_MS", "500"))
+    # Eventos de finalización de tareas Celery (mismo esquema fanout que los bloques)
+    TASK_EVENTS_EXCHANGE: str = os.getenv("TASK_EVENTS_EXCHANGE", "blockchain.tasks")
+    # Formato de mensajes: "msgpack" (compacto) o "json" (depuración)
+    WIRE_FORMAT: str = os.getenv("WIRE_FORMAT", "msgpack").lower()
+    WIRE_COMPRESSION_MIN_BYTES: int = int(os.getenv("WIRE_COMPRESSION_MIN_BYTES", "4096"))
     
     # Blockchain
     BLOCKCHAIN_DIFFICULTY: int = int(os.getenv("BLOCKCHAIN_DIFFICULTY", "4"))
     BLOCKCHAIN_MINING_REWARD: float = float(os.getenv("BLOCKCHAIN_MINING_REWARD", "100"))
+    # Lease del productor de bloques; se renueva mientras dura la prueba de trabajo
+    BLOCK_PRODUCER_LOCK_TTL_MS: int = int(os.getenv("BLOCK_PRODUCER_LOCK_TTL_MS", "30000"))
+    
+    # Validación paralela: bloques por rango repartido entre los workers
+    VALIDATION_RANGE_SIZE: int = int(os.getenv("VALIDATION_RANGE_SIZE", "1000"))
+    # Celery: tareas por proceso del worker antes de reciclarlo (0 = sin límite)
+    CELERY_MAX_TASKS_PER_CHILD: int = int(os.getenv("CELERY_MAX_TASKS_PER_CHILD", "0"))
+    # Minado automático: al alcanzar N transacciones pendientes o cuando la más
+    # antigua cumple T segundos; beat lo ejecuta además cada intervalo como respaldo
+    AUTO_MINE_ENABLED: bool = os.getenv("AUTO_MINE_ENABLED", "true").lower() == "true"
+    AUTO_MINE_MAX_PENDING: int = int(os.getenv("AUTO_MINE_MAX_PENDING", "500"))
+    AUTO_MINE_MAX_AGE: float = float(os.getenv("AUTO_MINE_MAX_AGE", "5"))
+    AUTO_MINE_FALLBACK_INTERVAL: int = int(os.getenv("AUTO_MINE_FALLBACK_INTERVAL", "60"))
+    
+    # Ingesta de transacciones
+    INGEST_CHUNK_SIZE: int = int(os.getenv("INGEST_CHUNK_SIZE", "500"))
+    INGEST_MAX_LINE_BYTES: int = int(os.getenv("INGEST_MAX_LINE_BYTES", "65536"))
+    
+    # Lotes asíncronos: tamaño de fragmento para procesarlos en paralelo (0 = sin dividir)
+    BATCH_CHUNK_SIZE: int = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))
+    BATCH_PROGRESS_TTL: int = int(os.getenv("BATCH_PROGRESS_TTL", "3600"))
+    
+    # Control de admisión del mempool (0 desactiva el límite)
+    MEMPOOL_MAX_TRANSACTIONS: int = int(os.getenv("MEMPOOL_MAX_TRANSACTIONS", "10000"))
+    MEMPOOL_MAX_BYTES: int = int(os.getenv("MEMPOOL_MAX_BYTES", str(16 * 1024 * 1024)))
+    MEMPOOL_RETRY_AFTER: int = int(os.getenv("MEMPOOL_RETRY_AFTER", "10"))
+    SENDER_RATE_LIMIT: float = float(os.getenv("SENDER_RATE_LIMIT", "10"))
+    SENDER_RATE_BURST: int = int(os.getenv("SENDER_RATE_BURST", "50"))
+    IDEMPOTENCY_TTL: int = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    # Reserva de una clave mientras la petición está en curso (debe superar el timeout de la petición)
+    IDEMPOTENCY_LOCK_TTL: int = int(os.getenv("IDEMPOTENCY_LOCK_TTL", "60"))
+    ENFORCE_BALANCE_CHECK: bool = os.getenv("ENFORCE_BALANCE_CHECK", "true").lower() == "true"
     
     # API
     BLOCKCHAIN_API_PORT: int = int(os.getenv("BLOCKCHAIN_API_PORT", "8000"))
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # WebSocket: mensajes pendientes por conexión y tiempo máximo por envío antes de expulsar al cliente
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    # Backplane de Redis pub/sub para entregar mensajes WebSocket entre procesos/réplicas de la API
+    WS_BACKPLANE_ENABLED: bool = os.getenv("WS_BACKPLANE_ENABLED", "false").lower() == "true"
+    # Intervalo de consulta del tamaño del mempool para el canal "mempool" (solo se envía si cambia)
+    MEMPOOL_PUSH_INTERVAL_MS: int = int(os.getenv("MEMPOOL_PUSH_INTERVAL_MS", "1000"))
     
     @property
     def postgres_url(self) -> str:
@@ -1,12 +1,12 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from psycopg2 import pool
 from contextlib import contextmanager
 from src.config import settings
 from src.utils import parse_amount
 import json
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
 from src.models import Block, Transaction
 
 
@@ -16,7 +16,8 @@ class Database:
     
     def initialize(self):
         try:
-            self.connection_pool = psycopg2.pool.SimpleConnectionPool(
+            # Thread-safe: lo comparten el threadpool de la API y los workers con pool de hilos
+            self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
                 1, 20,
                 host=settings.POSTGRES_HOST,
                 port=settings.POSTGRES_PORT,
@@ -72,12 +73,180 @@ class Database:
                     CREATE INDEX IF NOT EXISTS idx_blocks_hash ON blocks(hash);
                     CREATE INDEX IF NOT EXISTS idx_blocks_index ON blocks(index);
                     CREATE INDEX IF NOT EXISTS idx_transactions_block_index ON transactions(block_index);
+                    CREATE INDEX IF NOT EXISTS idx_blocks_timestamp ON blocks(timestamp);
                 """)
+                
+                # Balance confirmado por dirección (minúsculas), actualizado al guardar cada bloque
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS address_balances (
+                        address VARCHAR(255) PRIMARY KEY,
+                        balance NUMERIC(78, 0) NOT NULL DEFAULT 0
+                    );
+                """)
+                self._backfill_address_balances(cur)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_address_balances_balance ON address_balances(balance DESC);
+                """)
+                
+                # Agregados del reporte financiero, actualizados al guardar cada bloque
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS chain_stats (
+                        id SMALLINT PRIMARY KEY,
+                        total_blocks INTEGER NOT NULL DEFAULT 0,
+                        total_transactions BIGINT NOT NULL DEFAULT 0,
+                        total_volume NUMERIC(78, 0) NOT NULL DEFAULT 0,
+                        total_rewards NUMERIC(78, 0) NOT NULL DEFAULT 0,
+                        mining_rewards_count BIGINT NOT NULL DEFAULT 0
+                    );
+                    CREATE TABLE IF NOT EXISTS daily_stats (
+                        day DATE PRIMARY KEY,
+                        transactions BIGINT NOT NULL DEFAULT 0,
+                        volume NUMERIC(78, 0) NOT NULL DEFAULT 0
+                    );
+                """)
+                self._backfill_chain_stats(cur)
+                
+                # Serie temporal por hora (la diaria es daily_stats)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS hourly_stats (
+                        hour TIMESTAMP PRIMARY KEY,
+                        transactions BIGINT NOT NULL DEFAULT 0,
+                        volume NUMERIC(78, 0) NOT NULL DEFAULT 0
+                    );
+                """)
+                self._backfill_hourly_stats(cur)
+                
+                # Último token de cercado aceptado del productor de bloques (ver src/locks.py)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS block_producer_fence (
+                        id SMALLINT PRIMARY KEY,
+                        token BIGINT NOT NULL
+                    );
+                    INSERT INTO block_producer_fence (id, token) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+                """)
+    
+    def _backfill_address_balances(self, cur) -> None:
+        """Calcula los balances desde las transacciones existentes si la tabla está vacía"""
+        cur.execute("SELECT EXISTS (SELECT 1 FROM address_balances);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("LOCK TABLE address_balances IN EXCLUSIVE MODE;")
+        cur.execute("SELECT EXISTS (SELECT 1 FROM address_balances);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("""
+            INSERT INTO address_balances (address, balance)
+            SELECT address, SUM(delta) FROM (
+                SELECT LOWER(recipient) AS address, amount AS delta FROM transactions
+                UNION ALL
+                SELECT LOWER(sender) AS address, -amount AS delta FROM transactions
+            ) deltas
+            GROUP BY address
+            ON CONFLICT (address) DO NOTHING;
+        """)
+        if cur.rowcount:
+            print(f"✓ Balances por dirección calculados: {cur.rowcount} direcciones")
+    
+    def _backfill_chain_stats(self, cur) -> None:
+        """Calcula los agregados del reporte desde los bloques existentes si aún no existen"""
+        cur.execute("SELECT EXISTS (SELECT 1 FROM chain_stats);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("LOCK TABLE chain_stats, daily_stats IN EXCLUSIVE MODE;")
+        cur.execute("SELECT EXISTS (SELECT 1 FROM chain_stats);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("""
+            INSERT INTO chain_stats (id, total_blocks, total_transactions, total_volume,
+                                     total_rewards, mining_rewards_count)
+            SELECT 1,
+                   (SELECT COUNT(*) FROM blocks),
+                   COUNT(*),
+                   COALESCE(SUM(amount) FILTER (WHERE sender <> 'Sistema'), 0),
+                   COALESCE(SUM(amount) FILTER (WHERE sender = 'Sistema'), 0),
+                   COUNT(*) FILTER (WHERE sender = 'Sistema')
+            FROM transactions;
+        """)
+        cur.execute("""
+            INSERT INTO daily_stats (day, transactions, volume)
+            SELECT DATE(b.timestamp), COUNT(*), COALESCE(SUM(t.amount) FILTER (WHERE t.sender <> 'Sistema'), 0)
+            FROM transactions t
+            JOIN blocks b ON b.index = t.block_index
+            GROUP BY DATE(b.timestamp)
+            ON CONFLICT (day) DO NOTHING;
+        """)
+        print(f"✓ Estadísticas de la cadena calculadas: {cur.rowcount} días")
+    
+    def _backfill_hourly_stats(self, cur) -> None:
+        """Calcula la serie por hora desde las transacciones existentes si la tabla está vacía"""
+        cur.execute("SELECT EXISTS (SELECT 1 FROM hourly_stats);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("LOCK TABLE hourly_stats IN EXCLUSIVE MODE;")
+        cur.execute("SELECT EXISTS (SELECT 1 FROM hourly_stats);")
+        if cur.fetchone()[0]:
+            return
+        cur.execute("""
+            INSERT INTO hourly_stats (hour, transactions, volume)
+            SELECT DATE_TRUNC('hour', b.timestamp), COUNT(*),
+                   COALESCE(SUM(t.amount) FILTER (WHERE t.sender <> 'Sistema'), 0)
+            FROM transactions t
+            JOIN blocks b ON b.index = t.block_index
+            GROUP BY DATE_TRUNC('hour', b.timestamp)
+            ON CONFLICT (hour) DO NOTHING;
+        """)
+        if cur.rowcount:
+            print(f"✓ Estadísticas por hora calculadas: {cur.rowcount} horas")
     
-    def save_block(self, block: Block) -> bool:
+    def _update_chain_stats(self, cur, block: Block) -> None:
+        """Suma el bloque a los agregados del reporte (misma transacción que el bloque)"""
+        rewards = [int(tx.amount) for tx in block.transactions if tx.sender == "Sistema"]
+        volume = sum(int(tx.amount) for tx in block.transactions if tx.sender != "Sistema")
+        cur.execute("""
+            UPDATE chain_stats
+            SET total_blocks = total_blocks + 1,
+                total_transactions = total_transactions + %s,
+                total_volume = total_volume + %s,
+                total_rewards = total_rewards + %s,
+                mining_rewards_count = mining_rewards_count + %s
+            WHERE id = 1;
+        """, (len(block.transactions), volume, sum(rewards), len(rewards)))
+        if block.transactions:
+            cur.execute("""
+                INSERT INTO daily_stats (day, transactions, volume)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (day) DO UPDATE
+                SET transactions = daily_stats.transactions + EXCLUDED.transactions,
+                    volume = daily_stats.volume + EXCLUDED.volume;
+            """, (block.timestamp.date(), len(block.transactions), volume))
+            cur.execute("""
+                INSERT INTO hourly_stats (hour, transactions, volume)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (hour) DO UPDATE
+                SET transactions = hourly_stats.transactions + EXCLUDED.transactions,
+                    volume = hourly_stats.volume + EXCLUDED.volume;
+            """, (block.timestamp.replace(minute=0, second=0, microsecond=0), len(block.transactions), volume))
+    
+    def save_block(self, block: Block, balance_deltas: Optional[Dict[str, int]] = None,
+                   fencing_token: Optional[int] = None) -> bool:
+        """
+        Guarda el bloque, sus transacciones y la variación de balances en una
+        sola transacción. balance_deltas puede venir ya calculado por el minero.
+        Con fencing_token, el bloque se rechaza si ya se aceptó un token mayor
+        (el lease del productor expiró y otro minero lo tomó).
+        """
         try:
             with self.get_connection() as conn:
                 with conn.cursor() as cur:
+                    if fencing_token is not None:
+                        cur.execute("""
+                            UPDATE block_producer_fence SET token = %s
+                            WHERE id = 1 AND token <= %s;
+                        """, (fencing_token, fencing_token))
+                        if cur.rowcount == 0:
+                            print(f"⚠️  Bloque #{block.index} rechazado: token de cercado {fencing_token} obsoleto")
+                            return False
+                    
                     cur.execute("""
                         INSERT INTO blocks (index, timestamp, previous_hash, hash, nonce)
                         VALUES (%s, %s, %s, %s, %s)
@@ -105,55 +274,282 @@ class Database:
                                 int(tx.amount),  # Asegurar que es entero
                                 tx.timestamp
                             ))
+                        deltas = balance_deltas if balance_deltas is not None else block.balance_deltas()
+                        if deltas:
+                            execute_values(cur, """
+                                INSERT INTO address_balances (address, balance)
+                                VALUES %s
+                                ON CONFLICT (address) DO UPDATE
+                                SET balance = address_balances.balance + EXCLUDED.balance;
+                            """, list(deltas.items()))
+                        self._update_chain_stats(cur, block)
                         return True
                     return False
         except Exception as e:
             print(f"Error guardando bloque: {e}")
             return False
     
+    def get_fencing_token(self) -> int:
+        """Último token de cercado aceptado para la producción de bloques"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT token FROM block_producer_fence WHERE id = 1;")
+                row = cur.fetchone()
+                return int(row[0]) if row else 0
+    
+    def advance_fencing_token(self, token: int) -> bool:
+        """
+        Registra el token de un nuevo lease del productor de bloques: desde ese
+        momento se rechazan los bloques de cualquier propietario anterior.
+        Retorna False si ya se aceptó un token mayor (el lease es obsoleto).
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE block_producer_fence SET token = %s
+                    WHERE id = 1 AND token <= %s;
+                """, (token, token))
+                return cur.rowcount > 0
+    
+    def get_balances(self, addresses: List[str]) -> Dict[str, int]:
+        """Balances confirmados (en wei) de las direcciones indicadas; las ausentes valen 0"""
+        addresses = [address.lower() for address in addresses]
+        balances = {address: 0 for address in addresses}
+        if not addresses:
+            return balances
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT address, balance FROM address_balances WHERE address = ANY(%s);
+                """, (addresses,))
+                for address, balance in cur.fetchall():
+                    balances[address] = int(balance)
+        return balances
+
+    def get_balances_snapshot(self, addresses: List[str]) -> Tuple[int, Dict[str, int]]:
+        """
+        Balances confirmados junto con el índice del último bloque incluido en
+        ellos (-1 si no hay bloques), leídos en la misma instantánea
+        """
+        addresses = [address.lower() for address in addresses]
+        balances = {address: 0 for address in addresses}
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                cur.execute("SELECT COALESCE(MAX(index), -1) FROM blocks;")
+                height = int(cur.fetchone()[0])
+                if addresses:
+                    cur.execute("""
+                        SELECT address, balance FROM address_balances WHERE address = ANY(%s);
+                    """, (addresses,))
+                    for address, balance in cur.fetchall():
+                        balances[address] = int(balance)
+        return height, balances
+
+    def get_financial_aggregates(self, top: int = 10, recent: int = 10, days: int = 7) -> dict:
+        """
+        Datos del reporte financiero leídos de los agregados precalculados
+        (chain_stats, daily_stats, address_balances) en una sola instantánea:
+        summary, top_addresses, recent_transactions y daily (día -> (tx, volumen))
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                cur.execute("""
+                    SELECT total_blocks, total_transactions, total_volume, total_rewards, mining_rewards_count
+                    FROM chain_stats WHERE id = 1;
+                """)
+                row = cur.fetchone() or {}
+                summary = {key: int(row.get(key) or 0) for key in (
+                    'total_blocks', 'total_transactions', 'total_volume', 'total_rewards', 'mining_rewards_count'
+                )}
+                
+                cur.execute("""
+                    SELECT COUNT(*) AS count FROM address_balances WHERE address NOT IN ('', 'sistema');
+                """)
+                summary['unique_addresses'] = int(cur.fetchone()['count'])
+                
+                cur.execute("""
+                    SELECT address, balance FROM address_balances
+                    WHERE balance > 0 AND address NOT IN ('', 'sistema')
+                    ORDER BY balance DESC
+                    LIMIT %s;
+                """, (top,))
+                top_addresses = [(row['address'], int(row['balance'])) for row in cur.fetchall()]
+                
+                # Transacciones de los últimos 5 bloques, del más reciente al más antiguo
+                cur.execute("""
+                    SELECT t.sender, t.recipient, t.amount, t.timestamp AS tx_timestamp,
+                           t.block_index, b.timestamp AS block_timestamp
+                    FROM transactions t
+                    JOIN blocks b ON b.index = t.block_index
+                    WHERE t.block_index > (SELECT COALESCE(MAX(index), -1) FROM blocks) - 5
+                    ORDER BY t.block_index DESC, t.id ASC
+                    LIMIT %s;
+                """, (recent,))
+                recent_transactions = cur.fetchall()
+                
+                cur.execute("""
+                    SELECT day, transactions, volume FROM daily_stats
+                    WHERE day > %s;
+                """, (datetime.now().date() - timedelta(days=days),))
+                daily = {row['day']: (int(row['transactions']), int(row['volume'])) for row in cur.fetchall()}
+        
+        return {
+            'summary': summary,
+            'top_addresses': top_addresses,
+            'recent_transactions': recent_transactions,
+            'daily': daily
+        }
+    
+    def get_volume_timeseries(self, start: datetime, end: datetime, granularity: str = 'day') -> dict:
+        """
+        Transacciones y volumen por hora o por día con start <= periodo < end,
+        leídos de hourly_stats / daily_stats (solo los periodos con actividad),
+        junto con el número de bloques del intervalo (índice por timestamp)
+        """
+        if granularity == 'hour':
+            query = """
+                SELECT hour AS period, transactions, volume FROM hourly_stats
+                WHERE hour >= %s AND hour < %s ORDER BY hour ASC;
+            """
+            bounds = (start, end)
+        else:
+            query = """
+                SELECT day AS period, transactions, volume FROM daily_stats
+                WHERE day >= %s AND day < %s ORDER BY day ASC;
+            """
+            bounds = (start.date(), end.date())
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+                cur.execute(query, bounds)
+                points = [
+                    (row['period'], int(row['transactions']), int(row['volume']))
+                    for row in cur.fetchall()
+                ]
+                cur.execute("""
+                    SELECT COUNT(*) AS blocks FROM blocks WHERE timestamp >= %s AND timestamp < %s;
+                """, (start, end))
+                blocks = int(cur.fetchone()['blocks'])
+        return {'points': points, 'blocks': blocks}
+    
     def get_all_blocks(self) -> List[Block]:
         blocks = []
         try:
-            with self.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute("""
-                        SELECT * FROM blocks ORDER BY index ASC;
-                    """)
-                    block_rows = cur.fetchall()
-                    
-                    for block_row in block_rows:
-                        cur.execute("""
-                            SELECT sender, recipient, amount, timestamp
-                            FROM transactions
-                            WHERE block_index = %s
-                            ORDER BY id ASC;
-                        """, (block_row['index'],))
-                        
-                        tx_rows = cur.fetchall()
-                        transactions = [
-                            Transaction(
-                                sender=tx['sender'],
-                                recipient=tx['recipient'],
-                                amount=int(tx['amount']),  # Ya está en wei (entero)
-                                timestamp=tx['timestamp']
-                            )
-                            for tx in tx_rows
-                        ]
-                        
-                        block = Block(
-                            index=block_row['index'],
-                            timestamp=block_row['timestamp'],
-                            transactions=transactions,
-                            previous_hash=block_row['previous_hash'],
-                            hash=block_row['hash'],
-                            nonce=block_row['nonce']
-                        )
-                        blocks.append(block)
+            blocks = self.get_blocks_since(-1)
         except Exception as e:
             print(f"Error obteniendo bloques: {e}")
         
         return blocks
     
+    def get_blocks_since(self, after_index: int) -> List[Block]:
+        """
+        Bloques con índice mayor que after_index, en orden, con sus transacciones
+        (dos consultas en total, independientemente del número de bloques)
+        """
+        return self.get_blocks_range(after_index + 1)
+    
+    def get_blocks_range(self, start: int, end: Optional[int] = None) -> List[Block]:
+        """Bloques con start <= índice < end (sin límite superior si end es None)"""
+        end = 2 ** 31 - 1 if end is None else end
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT * FROM blocks WHERE index >= %s AND index < %s ORDER BY index ASC;
+                """, (start, end))
+                block_rows = cur.fetchall()
+                if not block_rows:
+                    return []
+                
+                cur.execute("""
+                    SELECT block_index, sender, recipient, amount, timestamp
+                    FROM transactions
+                    WHERE block_index >= %s AND block_index < %s
+                    ORDER BY block_index ASC, id ASC;
+                """, (start, end))
+                transactions_by_block: Dict[int, List[Transaction]] = {}
+                for tx in cur.fetchall():
+                    transactions_by_block.setdefault(tx['block_index'], []).append(
+                        Transaction(
+                            sender=tx['sender'],
+                            recipient=tx['recipient'],
+                            amount=int(tx['amount']),  # Ya está en wei (entero)
+                            timestamp=tx['timestamp']
+                        )
+                    )
+        
+        return [
+            Block(
+                index=block_row['index'],
+                timestamp=block_row['timestamp'],
+                transactions=transactions_by_block.get(block_row['index'], []),
+                previous_hash=block_row['previous_hash'],
+                hash=block_row['hash'],
+                nonce=block_row['nonce']
+            )
+            for block_row in block_rows
+        ]
+    
+    def iter_blocks(self, start: int = 0, itersize: int = 1000) -> Iterator[Block]:
+        """
+        Recorre los bloques desde start en orden de índice con un cursor del
+        lado del servidor: PostgreSQL entrega las filas en lotes de itersize y
+        solo se construye un bloque a la vez, así que la memoria no depende
+        del largo de la cadena.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor(name='iter_blocks', cursor_factory=RealDictCursor) as cur:
+                cur.itersize = itersize
+                cur.execute("""
+                    SELECT b.index, b.timestamp, b.previous_hash, b.hash, b.nonce,
+                           t.sender, t.recipient, t.amount, t.timestamp AS tx_timestamp
+                    FROM blocks b
+                    LEFT JOIN transactions t ON t.block_index = b.index
+                    WHERE b.index >= %s
+                    ORDER BY b.index ASC, t.id ASC;
+                """, (start,))
+                block_row, transactions = None, []
+                for row in cur:
+                    if block_row is not None and row['index'] != block_row['index']:
+                        yield self._build_block(block_row, transactions)
+                        transactions = []
+                    block_row = row
+                    if row['sender'] is not None:
+                        transactions.append(Transaction(
+                            sender=row['sender'],
+                            recipient=row['recipient'],
+                            amount=int(row['amount']),  # Ya está en wei (entero)
+                            timestamp=row['tx_timestamp']
+                        ))
+                if block_row is not None:
+                    yield self._build_block(block_row, transactions)
+    
+    @staticmethod
+    def _build_block(block_row: dict, transactions: List[Transaction]) -> Block:
+        return Block(
+            index=block_row['index'],
+            timestamp=block_row['timestamp'],
+            transactions=transactions,
+            previous_hash=block_row['previous_hash'],
+            hash=block_row['hash'],
+            nonce=block_row['nonce']
+        )
+    
+    def get_chain_height(self) -> int:
+        """Índice del último bloque (-1 si la cadena está vacía)"""
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COALESCE(MAX(index), -1) FROM blocks;")
+                return int(cur.fetchone()[0])
+    
+    def get_block_hash(self, index: int) -> Optional[str]:
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT hash FROM blocks WHERE index = %s;", (index,))
+                row = cur.fetchone()
+                return row[0] if row else None
+    
     def get_block_by_hash(self, hash: str) -> Optional[Block]:
         try:
             with self.get_connection() as conn:
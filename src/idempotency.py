@@ -0,0 +1,83 @@
+from src.config import settings
+from src.redis_client import redis_client
+from typing import Optional
+import hashlib
+import json
+
+
+IDEMPOTENCY_PREFIX = 'idempotency:'
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+
+class IdempotencyError(Exception):
+    """Conflicto con una clave de idempotencia ya usada"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IdempotencyStore:
+    """
+    Registro de claves de idempotencia en Redis.
+    Cada clave (por ámbito) se guarda bajo su hash junto con la huella del
+    cuerpo de la petición y, una vez completada, la respuesta original, que se
+    devuelve tal cual en los reintentos. Mientras la petición está en curso la
+    reserva dura solo IDEMPOTENCY_LOCK_TTL (si el proceso muere, la clave se
+    libera sola); la respuesta completada se conserva IDEMPOTENCY_TTL.
+    """
+
+    @staticmethod
+    def _redis_key(scope: str, key: str) -> str:
+        return IDEMPOTENCY_PREFIX + hashlib.sha256(f"{scope}:{key}".encode()).hexdigest()
+
+    @staticmethod
+    def _fingerprint(payload) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def begin(self, scope: str, key: str, payload) -> Optional[dict]:
+        """
+        Reserva la clave para una petición nueva.
+        Retorna la respuesta original si la clave ya se completó, o None si la
+        petición debe procesarse. Lanza IdempotencyError si la clave sigue en
+        proceso o se usó con un cuerpo distinto.
+        """
+        redis_key = self._redis_key(scope, key)
+        fingerprint = self._fingerprint(payload)
+        try:
+            if redis_client.client is None:
+                redis_client.initialize()
+            record = json.dumps({'status': IN_PROGRESS, 'fingerprint': fingerprint})
+            if redis_client.client.set(redis_key, record, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL):
+                return None
+            existing = redis_client.client.get(redis_key)
+        except Exception as e:
+            print(f"⚠️  No se pudo verificar la clave de idempotencia: {e}")
+            return None
+
+        if existing is None:
+            # Expiró entre SET y GET: reintentar la reserva
+            return self.begin(scope, key, payload)
+        existing = json.loads(existing)
+        if existing.get('fingerprint') != fingerprint:
+            raise IdempotencyError("La clave de idempotencia ya se usó con otra petición", 422)
+        if existing.get('status') != COMPLETED:
+            raise IdempotencyError("Hay una petición en curso con la misma clave de idempotencia", 409)
+        return existing.get('response')
+
+    def complete(self, scope: str, key: str, payload, response: dict) -> None:
+        """Guarda la respuesta para devolverla en los reintentos"""
+        record = json.dumps({
+            'status': COMPLETED,
+            'fingerprint': self._fingerprint(payload),
+            'response': response
+        }, default=str)
+        redis_client.set(self._redis_key(scope, key), record, ex=settings.IDEMPOTENCY_TTL)
+
+    def release(self, scope: str, key: str) -> None:
+        """Libera la clave tras un error para que el cliente pueda reintentar"""
+        redis_client.delete(self._redis_key(scope, key))
+
+
+idempotency_store = IdempotencyStore()
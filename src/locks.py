@@ -0,0 +1,109 @@
+from src.redis_client import redis_client
+from typing import Optional
+import threading
+import uuid
+
+
+class LockNotAcquired(Exception):
+    """Otro proceso tiene el lease del recurso"""
+
+
+# Adquiere el lease (SET NX PX) y emite un token de cercado (fencing token)
+# monótono. ARGV[3] es el último token aceptado por la base de datos: si Redis
+# perdió el contador, continúa desde ahí en lugar de volver a empezar.
+ACQUIRE_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+  return false
+end
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+if current < tonumber(ARGV[3]) then
+  redis.call('SET', KEYS[2], ARGV[3])
+end
+return redis.call('INCR', KEYS[2])
+"""
+
+# Renueva o libera el lease solo si sigue perteneciendo a este propietario
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLock:
+    """
+    Lock distribuido con lease en Redis y token de cercado.
+    El lease se renueva en segundo plano mientras se mantiene; si se pierde
+    (p. ej. una pausa larga del proceso), el token permite a la base de datos
+    rechazar las escrituras del antiguo propietario.
+
+        with LeaseLock('lock:block_producer', 30000, min_token=...) as lock:
+            ... lock.token ...
+    """
+
+    def __init__(self, name: str, ttl_ms: int, min_token: int = 0):
+        self.name = name
+        self.ttl_ms = ttl_ms
+        self.min_token = min_token
+        self.owner = uuid.uuid4().hex
+        self.token: Optional[int] = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._renewer: Optional[threading.Thread] = None
+
+    @property
+    def _fence_key(self) -> str:
+        return f"{self.name}:fence"
+
+    def acquire(self) -> bool:
+        if redis_client.client is None:
+            redis_client.initialize()
+        token = redis_client.client.eval(
+            ACQUIRE_SCRIPT, 2, self.name, self._fence_key, self.owner, self.ttl_ms, self.min_token
+        )
+        if not token:
+            return False
+        self.token = int(token)
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew_loop, name=f"lease-{self.name}", daemon=True)
+        self._renewer.start()
+        return True
+
+    def _renew_loop(self) -> None:
+        interval = self.ttl_ms / 3000
+        while not self._stop.wait(interval):
+            try:
+                renewed = redis_client.client.eval(RENEW_SCRIPT, 1, self.name, self.owner, self.ttl_ms)
+            except Exception as e:
+                print(f"⚠️  No se pudo renovar el lease {self.name}: {e}")
+                continue
+            if not renewed:
+                print(f"⚠️  Lease {self.name} perdido (token {self.token})")
+                self.lost = True
+                return
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+            self._renewer = None
+        try:
+            redis_client.client.eval(RELEASE_SCRIPT, 1, self.name, self.owner)
+        except Exception as e:
+            print(f"⚠️  No se pudo liberar el lease {self.name}: {e}")
+
+    def __enter__(self) -> "LeaseLock":
+        if not self.acquire():
+            raise LockNotAcquired(f"El recurso {self.name} está en uso")
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
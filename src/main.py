@@ -45,7 +45,8 @@ def initialize_services():
     for attempt in range(max_retries):
         try:
             print(f"Intento {attempt + 1}/{max_retries}: Conectando a RabbitMQ...")
-            rabbitmq_client.initialize()
+            # La API publica y consume con el cliente asyncio; aquí solo se verifica la conexión
+            rabbitmq_client.initialize(start_publisher=False)
             print("✓ RabbitMQ conectado")
             break
         except Exception as e:
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 from decimal import Decimal
 import hashlib
@@ -61,6 +61,16 @@ class Block(BaseModel):
         }, sort_keys=True)
         return hashlib.sha256(block_string.encode()).hexdigest()
     
+    def balance_deltas(self) -> Dict[str, int]:
+        """Variación de balance (en wei) por dirección en minúsculas que produce el bloque"""
+        deltas: Dict[str, int] = {}
+        for tx in self.transactions:
+            sender = tx.sender.lower() if tx.sender else ""
+            recipient = tx.recipient.lower() if tx.recipient else ""
+            deltas[sender] = deltas.get(sender, 0) - int(tx.amount)
+            deltas[recipient] = deltas.get(recipient, 0) + int(tx.amount)
+        return deltas
+    
     def mine_block(self, difficulty: int) -> None:
         target = "0" * difficulty
         while self.hash[:difficulty] != target:
@@ -105,33 +115,43 @@ class Blockchain(BaseModel):
     def add_transaction(self, transaction: Transaction) -> None:
         self.pending_transactions.append(transaction)
     
-    def mine_pending_transactions(self, mining_reward_address: str = None, include_reward: bool = True) -> None:
+    def create_block(self, transactions: List[Transaction], previous: Block,
+                     mining_reward_address: str = None, include_reward: bool = True) -> Block:
         """
-        Mina las transacciones pendientes
-        - mining_reward_address: Dirección que recibe la recompensa (opcional)
-        - include_reward: Si True, agrega recompensa de minería. Si False, mina sin recompensa
+        Arma y mina un bloque sobre `previous` sin agregarlo a la cadena
+        - include_reward: Si True y hay dirección, agrega la recompensa de minería
         """
+        transactions = list(transactions)
         # Solo agregar recompensa si se especifica y se requiere
         if include_reward and mining_reward_address:
             from src.utils import to_wei
             reward_wei = to_wei(self.mining_reward)
-            reward_tx = Transaction(
+            transactions.append(Transaction(
                 sender="Sistema",
                 recipient=mining_reward_address,
                 amount=reward_wei
-            )
-            self.pending_transactions.append(reward_tx)
+            ))
         
         block = Block(
-            index=len(self.chain),
+            index=previous.index + 1,
             timestamp=datetime.now(),
-            transactions=self.pending_transactions.copy(),
-            previous_hash=self.get_latest_block().hash,
+            transactions=transactions,
+            previous_hash=previous.hash,
             hash="",
             nonce=0
         )
         
         block.mine_block(self.difficulty)
+        return block
+    
+    def mine_pending_transactions(self, mining_reward_address: str = None, include_reward: bool = True) -> None:
+        """
+        Mina las transacciones pendientes
+        - mining_reward_address: Dirección que recibe la recompensa (opcional)
+        - include_reward: Si True, agrega recompensa de minería. Si False, mina sin recompensa
+        """
+        block = self.create_block(self.pending_transactions, self.get_latest_block(),
+                                  mining_reward_address, include_reward)
         self.chain.append(block)
         self.pending_transactions = []
     
@@ -156,16 +176,25 @@ class Blockchain(BaseModel):
                     balance += transaction.amount
         return balance
     
-    def is_chain_valid(self) -> bool:
-        for i in range(1, len(self.chain)):
+    def is_chain_valid(self, start: int = 1) -> bool:
+        return self.find_invalid_block(start) is None
+    
+    def find_invalid_block(self, start: int = 1, end: Optional[int] = None) -> Optional[int]:
+        """
+        Verifica el hash y el enlace con el bloque anterior de los bloques
+        [start, end) y retorna el índice del primero inválido (None si todos
+        son válidos)
+        """
+        end = len(self.chain) if end is None else min(end, len(self.chain))
+        for i in range(max(start, 1), end):
             current_block = self.chain[i]
             previous_block = self.chain[i - 1]
             
             if current_block.hash != current_block.calculate_hash():
-                return False
+                return i
             
             if current_block.previous_hash != previous_block.hash:
-                return False
+                return i
         
-        return True
+        return None
 
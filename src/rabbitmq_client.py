@@ -1,141 +1,368 @@
 import pika
-import json
+import pika.exceptions
+import os
+import queue
+import threading
+import time
 from src.config import settings
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional
 from src.models import Transaction, Block
+from src import wire
+
+
+QUEUES = ('transactions', 'mining')
+
+
+def destination(routing_key: str) -> tuple:
+    """
+    (exchange, routing_key) de publicación. Los eventos de bloque y de tareas
+    van a exchanges fanout para que cada réplica de la API los reciba todos
+    """
+    if routing_key == 'blocks':
+        return settings.BLOCK_EVENTS_EXCHANGE, ''
+    if routing_key == 'tasks':
+        return settings.TASK_EVENTS_EXCHANGE, ''
+    return '', routing_key
+
+
+def coalesce_messages(batch: list, max_batch_size: int) -> list:
+    """
+    Agrupa mensajes (routing_key, payload) encolados: los lotes de
+    transacciones consecutivos se combinan en un único mensaje (lista) de hasta
+    `max_batch_size` elementos; el resto se conserva tal cual y en orden.
+    """
+    messages = []
+    for routing_key, payload in batch:
+        if routing_key == 'transactions' and messages and messages[-1][0] == 'transactions' \
+                and len(messages[-1][1]) + len(payload) <= max_batch_size:
+            messages[-1][1].extend(payload)
+        elif routing_key == 'transactions':
+            messages.append((routing_key, list(payload)))
+        else:
+            messages.append((routing_key, payload))
+    return messages
 
 
 class RabbitMQClient:
+    """
+    Cliente de RabbitMQ.
+    Las publicaciones se encolan en un buffer acotado en memoria y las envía un
+    único hilo de I/O dueño de su propia conexión (pika no es thread-safe), con
+    confirmaciones del broker, agrupación de transacciones y reconexión automática.
+    Los consumidores abren su propia conexión en el hilo que los invoca.
+    """
+    
     def __init__(self):
         self.connection = None
         self.channel = None
+        self._buffer = queue.Queue(maxsize=settings.RABBITMQ_PUBLISH_BUFFER)
+        self._publisher_thread = None
+        self._publisher_pid = None
+        self._publisher_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._dropped = 0
+    
+    @staticmethod
+    def _connect():
+        credentials = pika.PlainCredentials(
+            settings.RABBITMQ_USER,
+            settings.RABBITMQ_PASSWORD
+        )
+        parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            credentials=credentials
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        for queue_name in QUEUES:
+            channel.queue_declare(queue=queue_name, durable=True)
+        for exchange in (settings.BLOCK_EVENTS_EXCHANGE, settings.TASK_EVENTS_EXCHANGE):
+            channel.exchange_declare(exchange=exchange, exchange_type='fanout', durable=True)
+        return connection, channel
     
-    def initialize(self):
+    def initialize(self, start_publisher: bool = True):
+        """
+        Verifica la conexión, declara las colas y arranca el hilo publicador
+        (start_publisher=False solo verifica la conexión)
+        """
         try:
-            credentials = pika.PlainCredentials(
-                settings.RABBITMQ_USER,
-                settings.RABBITMQ_PASSWORD
-            )
-            parameters = pika.ConnectionParameters(
-                host=settings.RABBITMQ_HOST,
-                port=settings.RABBITMQ_PORT,
-                credentials=credentials
-            )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            
-            self.channel.queue_declare(queue='transactions', durable=True)
-            self.channel.queue_declare(queue='blocks', durable=True)
-            self.channel.queue_declare(queue='mining', durable=True)
-            
+            connection, _ = self._connect()
+            connection.close()
+            if start_publisher:
+                self._ensure_publisher()
             print("Conexión a RabbitMQ establecida correctamente")
         except Exception as e:
             print(f"Error conectando a RabbitMQ: {e}")
             raise
     
-    def publish_transaction(self, transaction: Transaction) -> bool:
-        try:
-            message = json.dumps(transaction.to_dict())
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='transactions',
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
+    # ==================== Publicación ====================
+    
+    def _publisher_running(self) -> bool:
+        # Tras un fork (workers prefork de Celery) el hilo del padre no existe en el hijo
+        return (
+            self._publisher_thread is not None
+            and self._publisher_thread.is_alive()
+            and self._publisher_pid == os.getpid()
+        )
+    
+    def _ensure_publisher(self) -> None:
+        if self._publisher_running():
+            return
+        with self._publisher_lock:
+            if self._publisher_running():
+                return
+            self._stop.clear()
+            self._publisher_pid = os.getpid()
+            self._publisher_thread = threading.Thread(
+                target=self._run_publisher,
+                name="rabbitmq-publisher",
+                daemon=True
             )
+            self._publisher_thread.start()
+    
+    def _enqueue(self, routing_key: str, payload) -> bool:
+        """Encola un mensaje sin bloquear; si el buffer está lleno se descarta"""
+        self._ensure_publisher()
+        try:
+            self._buffer.put_nowait((routing_key, payload))
             return True
-        except Exception as e:
-            print(f"Error publicando transacción: {e}")
+        except queue.Full:
+            self._dropped += 1
+            if self._dropped % 1000 == 1:
+                print(f"⚠️  Buffer de publicación de RabbitMQ lleno; mensajes descartados: {self._dropped}")
             return False
     
+    def _next_batch(self) -> list:
+        """
+        Espera el siguiente mensaje y agrupa los que lleguen durante
+        RABBITMQ_PUBLISH_LINGER_MS. Las transacciones consecutivas se combinan
+        en un único mensaje (lista) de hasta RABBITMQ_PUBLISH_BATCH_SIZE elementos.
+        """
+        try:
+            first = self._buffer.get(timeout=1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + settings.RABBITMQ_PUBLISH_LINGER_MS / 1000
+        while len(batch) < settings.RABBITMQ_PUBLISH_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._buffer.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return coalesce_messages(batch, settings.RABBITMQ_PUBLISH_BATCH_SIZE)
+    
+    def _run_publisher(self) -> None:
+        """Bucle del hilo publicador: conecta, agrupa, publica con confirmación y reconecta"""
+        connection = None
+        channel = None
+        messages = []
+        backoff = 1
+        while not self._stop.is_set() or messages or not self._buffer.empty():
+            if channel is None:
+                try:
+                    connection, channel = self._connect()
+                    channel.confirm_delivery()
+                    backoff = 1
+                except Exception as e:
+                    print(f"⚠️  Publicador de RabbitMQ sin conexión, reintentando en {backoff}s: {e}")
+                    if self._stop.wait(backoff):
+                        break
+                    backoff = min(backoff * 2, 30)
+                    continue
+            
+            if not messages:
+                messages = self._next_batch()
+                if not messages:
+                    # Atender heartbeats mientras no hay nada que publicar
+                    try:
+                        connection.process_data_events(time_limit=0)
+                    except Exception:
+                        connection = None
+                        channel = None
+                    continue
+            
+            try:
+                while messages:
+                    routing_key, payload = messages[0]
+                    body, content_type, content_encoding = wire.encode(routing_key, payload)
+                    headers = {'x-wire-version': wire.WIRE_VERSION}
+                    if routing_key == 'transactions':
+                        headers['batch_size'] = len(payload)
+                    exchange, queue_key = destination(routing_key)
+                    # Con confirm_delivery, basic_publish retorna tras el ack del broker
+                    channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=queue_key,
+                        body=body,
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,
+                            content_type=content_type,
+                            content_encoding=content_encoding,
+                            headers=headers,
+                        )
+                    )
+                    messages.pop(0)
+            except pika.exceptions.NackError:
+                print(f"⚠️  RabbitMQ rechazó un mensaje para '{messages[0][0]}', reintentando")
+                time.sleep(0.1)
+            except Exception as e:
+                print(f"⚠️  Error publicando en RabbitMQ, reconectando: {e}")
+                try:
+                    if connection and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+                connection = None
+                channel = None
+        
+        try:
+            if connection and connection.is_open:
+                connection.close()
+        except Exception:
+            pass
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera a que el buffer de publicación se vacíe"""
+        deadline = time.monotonic() + timeout
+        while not self._buffer.empty():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+    
+    def publish_transaction(self, transaction: Transaction) -> bool:
+        return self.publish_transactions([transaction])
+    
+    def publish_transactions(self, transactions: List[Transaction]) -> bool:
+        """
+        Publica un lote de transacciones. El hilo publicador las combina con
+        otras pendientes en un único mensaje (lista JSON)
+        """
+        if not transactions:
+            return True
+        return self._enqueue('transactions', list(transactions))
+    
+    def publish_block(self, block: Block, balance_deltas: Optional[Dict[str, int]] = None) -> bool:
+        """Publica el evento del bloque (cabecera + variación de balances por dirección)"""
+        return self._enqueue('blocks', wire.block_event(block, balance_deltas))
+    
+    def publish_mining_request(self, mining_address: str) -> bool:
+        return self._enqueue('mining', {'mining_address': mining_address})
+    
+    def publish_task_event(self, task_id: str, task_name: str, state: str) -> bool:
+        """Notifica que una tarea Celery terminó; el resultado se consulta en /tasks/{task_id}"""
+        return self._enqueue('tasks', {'task_id': task_id, 'task_name': task_name, 'state': state})
+    
+    # ==================== Consumo ====================
+    
+    def _consume(self, declare_queue: Callable, on_message: Callable,
+                 prefetch: Optional[int] = None, on_connect: Optional[Callable] = None) -> None:
+        """
+        Consume una cola reconectando automáticamente si se pierde la conexión.
+        declare_queue(channel) retorna el nombre de la cola a consumir.
+        """
+        backoff = 1
+        while True:
+            try:
+                self.connection, self.channel = self._connect()
+                backoff = 1
+                if prefetch:
+                    self.channel.basic_qos(prefetch_count=prefetch)
+                queue_name = declare_queue(self.channel)
+                if on_connect:
+                    on_connect(self.connection, self.channel)
+                self.channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=on_message
+                )
+                self.channel.start_consuming()
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.ChannelClosedByBroker) as e:
+                print(f"⚠️  Conexión de consumo perdida, reintentando en {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+    
     def consume_transactions(self, callback: Callable) -> None:
+        """
+        Consume la cola de transacciones. Los mensajes pueden contener una
+        transacción o un lote (lista); el callback recibe siempre una transacción.
+        """
         try:
             def on_message(ch, method, properties, body):
                 try:
-                    tx_data = json.loads(body)
-                    transaction = Transaction(**tx_data)
-                    callback(transaction)
+                    tx_data = wire.decode(body, properties.content_type, properties.content_encoding)
+                    for item in (tx_data if isinstance(tx_data, list) else [tx_data]):
+                        callback(Transaction(**item))
                     ch.basic_ack(delivery_tag=method.delivery_tag)
                 except Exception as e:
                     print(f"Error procesando mensaje: {e}")
                     ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
             
-            self.channel.basic_consume(
-                queue='transactions',
-                on_message_callback=on_message
-            )
-            self.channel.start_consuming()
+            self._consume(lambda channel: 'transactions', on_message)
         except Exception as e:
             print(f"Error consumiendo transacciones: {e}")
-
+    
     def consume_blocks(self, callback: Callable) -> None:
         """
-        Consume mensajes de la cola de bloques y ejecuta el callback por cada bloque.
-        Se espera que el callback reciba un dict con los datos del bloque.
+        Consume los eventos de bloque desde una cola exclusiva enlazada al
+        exchange fanout (cada consumidor recibe todos los bloques) y ejecuta el
+        callback por cada uno. El callback recibe el evento del bloque (dict con
+        la cabecera y balance_deltas). Los acks se agrupan (BLOCK_EVENTS_ACK_BATCH
+        mensajes o BLOCK_EVENTS_ACK_INTERVAL_MS).
         """
+        unacked = {'tag': None, 'count': 0}
+        
+        def flush_acks(channel):
+            if unacked['tag'] is not None:
+                channel.basic_ack(delivery_tag=unacked['tag'], multiple=True)
+                unacked['tag'] = None
+                unacked['count'] = 0
+        
+        def declare_queue(channel) -> str:
+            result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+            channel.queue_bind(queue=result.method.queue, exchange=settings.BLOCK_EVENTS_EXCHANGE)
+            return result.method.queue
+        
+        def on_connect(connection, channel):
+            unacked['tag'] = None
+            unacked['count'] = 0
+            interval = settings.BLOCK_EVENTS_ACK_INTERVAL_MS / 1000
+            
+            def tick():
+                if channel.is_open:
+                    flush_acks(channel)
+                    connection.call_later(interval, tick)
+            connection.call_later(interval, tick)
+        
         try:
             def on_message(ch, method, properties, body):
                 try:
-                    block_data = json.loads(body)
+                    block_data = wire.decode(body, properties.content_type, properties.content_encoding)
                     callback(block_data)
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    unacked['tag'] = method.delivery_tag
+                    unacked['count'] += 1
+                    if unacked['count'] >= settings.BLOCK_EVENTS_ACK_BATCH:
+                        flush_acks(ch)
                 except Exception as e:
                     print(f"Error procesando bloque desde RabbitMQ: {e}")
+                    flush_acks(ch)
                     ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-
-            self.channel.basic_consume(
-                queue='blocks',
-                on_message_callback=on_message
-            )
-            self.channel.start_consuming()
+            
+            self._consume(declare_queue, on_message, settings.BLOCK_EVENTS_PREFETCH, on_connect)
         except Exception as e:
             print(f"Error consumiendo bloques: {e}")
     
-    def publish_block(self, block: Block) -> bool:
-        try:
-            block_data = {
-                'index': block.index,
-                'timestamp': block.timestamp.isoformat(),
-                'transactions': [tx.to_dict() for tx in block.transactions],
-                'previous_hash': block.previous_hash,
-                'hash': block.hash,
-                'nonce': block.nonce
-            }
-            message = json.dumps(block_data)
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='blocks',
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
-            return True
-        except Exception as e:
-            print(f"Error publicando bloque: {e}")
-            return False
-    
-    def publish_mining_request(self, mining_address: str) -> bool:
-        try:
-            message = json.dumps({'mining_address': mining_address})
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='mining',
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
-            return True
-        except Exception as e:
-            print(f"Error publicando solicitud de minería: {e}")
-            return False
-    
     def close(self):
+        """Detiene el hilo publicador (tras vaciar el buffer) y cierra la conexión de consumo"""
+        self._stop.set()
+        if self._publisher_thread is not None and self._publisher_pid == os.getpid():
+            self._publisher_thread.join(timeout=5)
         if self.connection and not self.connection.is_closed:
             self.connection.close()
 
 
 rabbitmq_client = RabbitMQClient()
-
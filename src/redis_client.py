@@ -1,7 +1,23 @@
 import redis
 from src.config import settings
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import json
+import time
+
+
+# Mempool: lista de Redis con una transacción serializada por elemento
+PENDING_TX_KEY = 'blockchain:pending_tx'
+PENDING_TX_BYTES_KEY = 'blockchain:pending_tx:bytes'
+# Salidas pendientes por remitente (wei como texto; pueden exceder 64 bits)
+PENDING_OUTFLOW_PREFIX = 'blockchain:pending_tx:outflow:'
+# Índice del último bloque cuyas salidas ya se liberaron del mempool
+PENDING_RELEASED_HEIGHT_KEY = 'blockchain:pending_tx:released_height'
+# Esperas (de RELEASE_WAIT_SECONDS) a que el minero libere las salidas de un
+# bloque ya confirmado antes de comprobar el saldo de forma conservadora
+RELEASE_WAIT_ATTEMPTS = 50
+RELEASE_WAIT_SECONDS = 0.02
+# Último bloque verificado por la validación incremental de la cadena
+VALIDATION_CHECKPOINT_KEY = 'blockchain:validation_checkpoint'
 
 
 class RedisClient:
@@ -17,6 +33,7 @@ class RedisClient:
                 decode_responses=True
             )
             self.client.ping()
+            self._migrate_pending_transactions()
             print("Conexión a Redis establecida correctamente")
         except Exception as e:
             print(f"Error conectando a Redis: {e}")
@@ -71,24 +88,195 @@ class RedisClient:
             print(f"Error obteniendo estado de blockchain: {e}")
             return None
     
+    def cache_validation_checkpoint(self, checkpoint: dict) -> bool:
+        """Último resultado de validación: {height, tip_hash, is_valid, invalid_index}"""
+        try:
+            return self.set(VALIDATION_CHECKPOINT_KEY, json.dumps(checkpoint))
+        except Exception as e:
+            print(f"Error guardando checkpoint de validación: {e}")
+            return False
+    
+    def get_validation_checkpoint(self) -> Optional[dict]:
+        try:
+            checkpoint_json = self.get(VALIDATION_CHECKPOINT_KEY)
+            return json.loads(checkpoint_json) if checkpoint_json else None
+        except Exception as e:
+            print(f"Error obteniendo checkpoint de validación: {e}")
+            return None
+    
+    def _migrate_pending_transactions(self) -> None:
+        """Convierte el mempool antiguo (un único blob JSON) al formato de lista"""
+        try:
+            if self.client.type(PENDING_TX_KEY) != 'string':
+                return
+            tx_list = json.loads(self.client.get(PENDING_TX_KEY) or '[]')
+            self.cache_pending_transactions(tx_list)
+            print(f"✓ Mempool migrado a lista de Redis: {len(tx_list)} transacciones")
+        except Exception as e:
+            print(f"⚠️  No se pudo migrar el mempool a lista: {e}")
+    
+    @staticmethod
+    def _serialize_transactions(transactions: list) -> list:
+        """Serializa transacciones (objetos, dicts o JSON ya serializado) para el mempool"""
+        return [
+            tx if isinstance(tx, str) else json.dumps(tx.to_dict() if hasattr(tx, 'to_dict') else tx)
+            for tx in transactions
+        ]
+    
+    @staticmethod
+    def _outflows_from_payloads(tx_list: list) -> Dict[str, int]:
+        """Suma los montos pendientes por remitente (minúsculas) de una lista de payloads"""
+        outflows: Dict[str, int] = {}
+        for tx_json in tx_list:
+            tx = json.loads(tx_json)
+            sender = (tx.get('sender') or '').lower()
+            outflows[sender] = outflows.get(sender, 0) + int(tx.get('amount', 0))
+        return outflows
+    
     def cache_pending_transactions(self, transactions: list) -> bool:
+        """
+        Reemplaza por completo el mempool (y el índice de salidas pendientes) con
+        la lista indicada. No es seguro con escrituras concurrentes: solo se usa
+        en la migración del formato antiguo, antes de aceptar transacciones.
+        """
         try:
-            tx_list = [tx.to_dict() if hasattr(tx, 'to_dict') else tx for tx in transactions]
-            return self.set('blockchain:pending_tx', json.dumps(tx_list), ex=300)
+            tx_list = self._serialize_transactions(transactions)
+            stale_outflows = list(self.client.scan_iter(match=PENDING_OUTFLOW_PREFIX + '*', count=1000))
+            pipe = self.client.pipeline(transaction=True)
+            pipe.delete(PENDING_TX_KEY, PENDING_TX_BYTES_KEY, *stale_outflows)
+            if tx_list:
+                pipe.rpush(PENDING_TX_KEY, *tx_list)
+                pipe.set(PENDING_TX_BYTES_KEY, sum(len(tx) for tx in tx_list))
+                for sender, amount in self._outflows_from_payloads(tx_list).items():
+                    pipe.set(PENDING_OUTFLOW_PREFIX + sender, amount)
+            pipe.execute()
+            return True
         except Exception as e:
             print(f"Error cacheando transacciones pendientes: {e}")
             return False
     
+    def append_pending_transactions(self, entries: List[Tuple[str, int, str]],
+                                    load_spendable: Optional[Callable[[List[str]], Tuple[int, Dict[str, int]]]] = None
+                                    ) -> Optional[Tuple[int, List[bool]]]:
+        """
+        Agrega transacciones al final del mempool en una sola transacción de Redis
+        y reserva su monto en el índice de salidas pendientes de cada remitente.
+        - entries: (remitente en minúsculas, monto en wei, payload JSON) por transacción
+        - load_spendable: lee (altura de la cadena, balance confirmado) de los
+          remitentes indicados. Si se indica, solo se admiten las transacciones cuyo
+          monto no supera el balance menos las salidas pendientes (incluidas las
+          anteriores del mismo lote). Se llama después de WATCH sobre las salidas:
+          si un bloque libera sus salidas antes del EXEC, la comprobación se repite.
+          Si la altura leída es mayor que la del último bloque liberado (el bloque
+          ya descontó el balance pero sus salidas siguen reservadas), se espera a
+          la liberación para no descontar dos veces el mismo monto
+        Retorna (nuevo tamaño del mempool, admitida sí/no por entrada), o None si falla
+        """
+        try:
+            outflow_keys = {sender: PENDING_OUTFLOW_PREFIX + sender for sender, _, _ in entries}
+            release_waits = 0
+            with self.client.pipeline(transaction=True) as pipe:
+                while True:
+                    try:
+                        pipe.watch(PENDING_RELEASED_HEIGHT_KEY, *outflow_keys.values())
+                        released_height = pipe.get(PENDING_RELEASED_HEIGHT_KEY)
+                        current = pipe.mget(list(outflow_keys.values())) if outflow_keys else []
+                        outflows = {sender: int(value or 0) for sender, value in zip(outflow_keys, current)}
+                        spendable = None
+                        if load_spendable:
+                            height, spendable = load_spendable(list(outflow_keys))
+                            if (released_height is not None and height > int(released_height)
+                                    and release_waits < RELEASE_WAIT_ATTEMPTS):
+                                pipe.reset()
+                                release_waits += 1
+                                time.sleep(RELEASE_WAIT_SECONDS)
+                                continue
+                        
+                        accepted = []
+                        for sender, amount, _ in entries:
+                            admitted = spendable is None or amount <= spendable.get(sender, 0) - outflows[sender]
+                            if admitted:
+                                outflows[sender] += amount
+                            accepted.append(admitted)
+                        tx_list = [payload for (_, _, payload), ok in zip(entries, accepted) if ok]
+                        
+                        pipe.multi()
+                        if tx_list:
+                            pipe.rpush(PENDING_TX_KEY, *tx_list)
+                            pipe.incrby(PENDING_TX_BYTES_KEY, sum(len(tx) for tx in tx_list))
+                            for sender, amount in outflows.items():
+                                pipe.set(outflow_keys[sender], amount)
+                        else:
+                            pipe.llen(PENDING_TX_KEY)
+                        return pipe.execute()[0], accepted
+                    except redis.WatchError:
+                        continue
+        except Exception as e:
+            print(f"Error agregando transacciones pendientes: {e}")
+            return None
+    
+    def remove_pending_transactions(self, count: int, block_index: Optional[int] = None) -> bool:
+        """
+        Elimina las primeras `count` transacciones del mempool (ya minadas)
+        y libera sus montos del índice de salidas pendientes. block_index (el
+        bloque que las confirmó) se registra en la misma transacción de Redis
+        como última altura liberada
+        """
+        try:
+            if count <= 0:
+                if block_index is not None:
+                    self.client.set(PENDING_RELEASED_HEIGHT_KEY, block_index)
+                return True
+            removed = self.client.lrange(PENDING_TX_KEY, 0, count - 1)
+            released = self._outflows_from_payloads(removed)
+            outflow_keys = {sender: PENDING_OUTFLOW_PREFIX + sender for sender in released}
+            with self.client.pipeline(transaction=True) as pipe:
+                while True:
+                    try:
+                        if outflow_keys:
+                            pipe.watch(*outflow_keys.values())
+                        current = pipe.mget(list(outflow_keys.values())) if outflow_keys else []
+                        pipe.multi()
+                        pipe.ltrim(PENDING_TX_KEY, count, -1)
+                        if block_index is not None:
+                            pipe.set(PENDING_RELEASED_HEIGHT_KEY, block_index)
+                        pipe.decrby(PENDING_TX_BYTES_KEY, sum(len(tx) for tx in removed))
+                        for (sender, key), value in zip(outflow_keys.items(), current):
+                            remaining = int(value or 0) - released[sender]
+                            if remaining > 0:
+                                pipe.set(key, remaining)
+                            else:
+                                pipe.delete(key)
+                        pipe.execute()
+                        return True
+                    except redis.WatchError:
+                        continue
+        except Exception as e:
+            print(f"Error eliminando transacciones pendientes: {e}")
+            return False
+    
+    def get_pending_outflows(self, addresses: List[str]) -> Dict[str, int]:
+        """Montos pendientes de confirmar (en wei) enviados por cada dirección"""
+        addresses = [address.lower() for address in addresses]
+        if not addresses:
+            return {}
+        values = self.client.mget([PENDING_OUTFLOW_PREFIX + address for address in addresses])
+        return {address: int(value or 0) for address, value in zip(addresses, values)}
+    
+    def get_mempool_usage(self) -> tuple:
+        """Retorna (número de transacciones, bytes) del mempool"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(PENDING_TX_KEY)
+        pipe.get(PENDING_TX_BYTES_KEY)
+        count, size = pipe.execute()
+        return count, max(int(size or 0), 0)
+    
     def get_pending_transactions(self) -> list:
         try:
-            tx_json = self.get('blockchain:pending_tx')
-            if tx_json:
-                return json.loads(tx_json)
-            return []
+            return [json.loads(tx_json) for tx_json in self.client.lrange(PENDING_TX_KEY, 0, -1)]
         except Exception as e:
             print(f"Error obteniendo transacciones pendientes: {e}")
             return []
 
-
 redis_client = RedisClient()
 
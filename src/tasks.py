@@ -1,45 +1,83 @@
-from celery import Task
+from celery import Task, chord, group
 from celery.schedules import crontab
+from celery.signals import task_postrun, worker_process_init, worker_process_shutdown
 from src.celery_app import celery_app
-from src.blockchain_service import BlockchainService
+from src.config import settings
+from src.blockchain_service import get_blockchain_service
 from src.database import db
 from src.redis_client import redis_client
 from src.rabbitmq_client import rabbitmq_client
+from src.locks import LockNotAcquired
+from src.auto_mining import auto_mining_trigger
+from src.chain_validation import validate_range, merge_range_results, validate_stream
 from src.models import Transaction, Block
 from src.utils import parse_amount, format_amount
 from typing import Optional, Dict
+import threading
 import traceback
 import time
 
 
+_services_initialized = False
+# El worker de ingesta usa un pool de hilos: las primeras tareas llegan en paralelo
+_services_lock = threading.Lock()
+
+
+def initialize_services():
+    """
+    Inicializa una sola vez por proceso las conexiones compartidas por todas
+    las tareas (pool de PostgreSQL, Redis y RabbitMQ)
+    """
+    global _services_initialized
+    if _services_initialized:
+        return
+    with _services_lock:
+        if _services_initialized:
+            return
+        try:
+            # Inicializar base de datos
+            if db.connection_pool is None:
+                db.initialize()
+            # Inicializar Redis
+            if redis_client.client is None:
+                redis_client.initialize()
+            # Inicializar RabbitMQ (opcional para tareas)
+            try:
+                rabbitmq_client.initialize()
+            except:
+                pass  # No crítico para tareas
+            _services_initialized = True
+        except Exception as e:
+            print(f"⚠️  Advertencia al inicializar servicios: {e}")
+
+
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """
+    Al arrancar cada proceso del worker: conexiones y cadena en memoria listas
+    antes de la primera tarea. Después la cadena se sincroniza de forma
+    incremental (solo bloques nuevos).
+    """
+    initialize_services()
+    try:
+        service = get_blockchain_service()
+        print(f"✓ Worker listo con {len(service.blockchain.chain)} bloques en memoria")
+    except Exception as e:
+        print(f"⚠️  No se pudo precargar la cadena en el worker: {e}")
+
+
 class BlockchainTask(Task):
     """Clase base para tareas de blockchain con manejo de errores"""
-    _blockchain_service = None
-    _services_initialized = False
     
     def initialize_services(self):
         """Inicializa los servicios necesarios para las tareas"""
-        if not self._services_initialized:
-            try:
-                # Inicializar base de datos
-                db.initialize()
-                # Inicializar Redis
-                redis_client.initialize()
-                # Inicializar RabbitMQ (opcional para tareas)
-                try:
-                    rabbitmq_client.initialize()
-                except:
-                    pass  # No crítico para tareas
-                self._services_initialized = True
-            except Exception as e:
-                print(f"⚠️  Advertencia al inicializar servicios: {e}")
+        initialize_services()
     
     @property
     def blockchain_service(self):
-        if self._blockchain_service is None:
-            self.initialize_services()
-            self._blockchain_service = BlockchainService()
-        return self._blockchain_service
+        # Instancia compartida por todas las tareas del proceso
+        initialize_services()
+        return get_blockchain_service()
     
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """Manejo de errores en tareas"""
@@ -47,12 +85,42 @@ class BlockchainTask(Task):
         print(f"Traceback: {traceback.format_exc()}")
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.mine_block_task')
+@worker_process_shutdown.connect
+def flush_rabbitmq_publisher(**kwargs):
+    """Publica los mensajes pendientes antes de que el proceso del worker termine"""
+    rabbitmq_client.close()
+
+
+def block_summary(block: Block) -> Dict:
+    """
+    Resumen del bloque para el resultado de la tarea (backend de Redis).
+    Las transacciones se consultan en PostgreSQL por hash:
+    /block/{hash} o /tasks/{task_id}?expand=true
+    """
+    return {
+        'index': block.index,
+        'timestamp': block.timestamp.isoformat(),
+        'transactions_count': len(block.transactions),
+        'previous_hash': block.previous_hash,
+        'hash': block.hash,
+        'nonce': block.nonce
+    }
+
+
+@task_postrun.connect
+def publish_task_completion(task_id=None, task=None, state=None, **kwargs):
+    """Publica la finalización de la tarea para los suscriptores del canal task:<id>"""
+    if state in ('SUCCESS', 'FAILURE', 'REVOKED'):
+        rabbitmq_client.publish_task_event(task_id, task.name if task else None, state)
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.mine_block_task', priority=9, max_retries=12)
 def mine_block_task(self, mining_reward_address: str = None, include_reward: bool = True) -> Dict:
     """
     Tarea asíncrona para minar un bloque
     - mining_reward_address: Dirección que recibe la recompensa (opcional)
     - include_reward: Si True, agrega recompensa de minería. Si False, mina sin recompensa
+    Si otro minero tiene el lease del productor de bloques, se reintenta más tarde.
     """
     try:
         # Asegurar que los servicios estén inicializados
@@ -78,14 +146,7 @@ def mine_block_task(self, mining_reward_address: str = None, include_reward: boo
         )
         
         if block:
-            block_dict = {
-                'index': block.index,
-                'timestamp': block.timestamp.isoformat(),
-                'transactions': [tx.to_dict() for tx in block.transactions],
-                'previous_hash': block.previous_hash,
-                'hash': block.hash,
-                'nonce': block.nonce
-            }
+            block_dict = block_summary(block)
             
             print(f"✅ Bloque #{block.index} minado exitosamente {reward_msg}")
             
@@ -100,6 +161,9 @@ def mine_block_task(self, mining_reward_address: str = None, include_reward: boo
                 'message': 'Error al guardar el bloque en la base de datos',
                 'block': None
             }
+    except LockNotAcquired:
+        print("⏳ Otro minero está produciendo un bloque; reintentando más tarde")
+        raise self.retry(countdown=5)
     except Exception as e:
         error_msg = f"Error en minería: {str(e)}"
         print(f"❌ {error_msg}")
@@ -112,11 +176,12 @@ def mine_block_task(self, mining_reward_address: str = None, include_reward: boo
         }
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.auto_mine_task')
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.auto_mine_task', priority=5)
 def auto_mine_task(self) -> Dict:
     """
     Tarea automática para minar bloques sin recompensa
-    Se ejecuta periódicamente para confirmar transacciones pendientes automáticamente
+    La programa el mempool al llenarse o al envejecer (src/auto_mining.py);
+    Celery beat la ejecuta además periódicamente como respaldo
     """
     try:
         # Asegurar que los servicios estén inicializados
@@ -126,6 +191,7 @@ def auto_mine_task(self) -> Dict:
         pending_count = len(self.blockchain_service.get_pending_transactions())
         
         if pending_count == 0:
+            auto_mining_trigger.reset()
             return {
                 'success': False,
                 'message': 'No hay transacciones pendientes para minar',
@@ -142,14 +208,7 @@ def auto_mine_task(self) -> Dict:
         )
         
         if block:
-            block_dict = {
-                'index': block.index,
-                'timestamp': block.timestamp.isoformat(),
-                'transactions_count': len(block.transactions),
-                'previous_hash': block.previous_hash,
-                'hash': block.hash,
-                'nonce': block.nonce
-            }
+            block_dict = block_summary(block)
             
             print(f"✅ Worker {self.request.hostname}: Bloque #{block.index} minado automáticamente (sin recompensa)")
             
@@ -166,6 +225,14 @@ def auto_mine_task(self) -> Dict:
                 'block': None,
                 'worker': self.request.hostname
             }
+    except LockNotAcquired:
+        # Otro minero ya está confirmando el mempool: esta ejecución sobra
+        return {
+            'success': False,
+            'message': 'Otro minero está produciendo un bloque',
+            'block': None,
+            'worker': self.request.hostname
+        }
     except Exception as e:
         error_msg = f"Error en minería automática: {str(e)}"
         print(f"❌ Worker {self.request.hostname}: {error_msg}")
@@ -179,7 +246,7 @@ def auto_mine_task(self) -> Dict:
         }
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.process_transaction_task')
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.process_transaction_task', priority=9)
 def process_transaction_task(self, sender: str, recipient: str, amount: float) -> Dict:
     """
     Tarea asíncrona para procesar una transacción
@@ -214,22 +281,58 @@ def process_transaction_task(self, sender: str, recipient: str, amount: float) -
         }
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.validate_chain_task')
-def validate_chain_task(self) -> Dict:
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.validate_chain_task', priority=1)
+def validate_chain_task(self, full: bool = False, parallel: bool = False, stream: bool = False) -> Dict:
     """
     Tarea asíncrona para validar la cadena de bloques
+    - full: Si True, valida desde el génesis ignorando el checkpoint
+    - parallel: Si True, revalida la cadena completa repartiendo rangos de
+      VALIDATION_RANGE_SIZE bloques entre los workers (chord) y comprueba
+      después las fronteras entre rangos
+    - stream: Si True, revalida la cadena completa leyéndola de PostgreSQL con
+      un cursor del lado del servidor, sin cargarla en memoria
     """
+    if parallel:
+        self.initialize_services()
+        height = db.get_chain_height()
+        size = max(settings.VALIDATION_RANGE_SIZE, 1)
+        ranges = [
+            validate_block_range_task.s(start, min(start + size, height + 1))
+            for start in range(0, height + 1, size)
+        ]
+        # La tarea de agregación hereda el id de esta tarea
+        raise self.replace(chord(group(ranges), aggregate_chain_validation_task.s()))
+    
     try:
         self.initialize_services()
         
-        is_valid = self.blockchain_service.is_chain_valid()
-        chain_length = len(self.blockchain_service.get_chain())
+        if stream:
+            validation = validate_stream(db.iter_blocks())
+            if validation['height'] >= 0:
+                redis_client.cache_validation_checkpoint({
+                    key: validation[key] for key in ('is_valid', 'height', 'tip_hash', 'invalid_index')
+                })
+            is_valid = validation['is_valid']
+            return {
+                'success': True,
+                'is_valid': is_valid,
+                'chain_length': validation['height'] + 1 if is_valid else None,
+                'invalid_index': validation['invalid_index'],
+                'validated_blocks': validation['validated'],
+                'message': 'Cadena válida' if is_valid else f"Cadena inválida (bloque #{validation['invalid_index']})"
+            }
+        
+        validation = self.blockchain_service.validate_chain(full=full)
+        is_valid = validation['is_valid']
+        chain_length = len(self.blockchain_service.blockchain.chain)
         
         return {
             'success': True,
             'is_valid': is_valid,
             'chain_length': chain_length,
-            'message': 'Cadena válida' if is_valid else 'Cadena inválida'
+            'invalid_index': validation['invalid_index'],
+            'validated_from': validation['validated_from'],
+            'message': 'Cadena válida' if is_valid else f"Cadena inválida (bloque #{validation['invalid_index']})"
         }
     except Exception as e:
         error_msg = f"Error validando cadena: {str(e)}"
@@ -241,7 +344,36 @@ def validate_chain_task(self) -> Dict:
         }
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.update_cache_task')
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.validate_block_range_task', priority=1)
+def validate_block_range_task(self, start: int, end: int) -> Dict:
+    """Valida los bloques [start, end) leyéndolos directamente de PostgreSQL"""
+    self.initialize_services()
+    return validate_range(db.get_blocks_range(start, end))
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.aggregate_chain_validation_task', priority=1)
+def aggregate_chain_validation_task(self, range_results: list) -> Dict:
+    """Comprueba las fronteras entre rangos y reporta el primer bloque inválido"""
+    self.initialize_services()
+    validation = merge_range_results(range_results)
+    if validation['invalid_index'] is not None:
+        validation['tip_hash'] = db.get_block_hash(validation['invalid_index'])
+    if validation['height'] >= 0:
+        redis_client.cache_validation_checkpoint({
+            key: validation[key] for key in ('is_valid', 'height', 'tip_hash', 'invalid_index')
+        })
+    is_valid = validation['is_valid']
+    return {
+        'success': True,
+        'is_valid': is_valid,
+        'chain_length': validation['height'] + 1 if is_valid else None,
+        'invalid_index': validation['invalid_index'],
+        'ranges': validation['ranges'],
+        'message': 'Cadena válida' if is_valid else f"Cadena inválida (bloque #{validation['invalid_index']})"
+    }
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.update_cache_task', priority=3)
 def update_cache_task(self) -> Dict:
     """
     Tarea asíncrona para actualizar la caché de Redis
@@ -257,14 +389,15 @@ def update_cache_task(self) -> Dict:
                 latest_block.hash
             )
             
-            pending_tx = self.blockchain_service.get_pending_transactions()
-            redis_client.cache_pending_transactions(pending_tx)
+            # El mempool vive en Redis como lista de solo agregado: no se reescribe
+            # aquí (se perderían las transacciones que lleguen mientras tanto)
+            pending_count, _ = redis_client.get_mempool_usage()
             
             return {
                 'success': True,
                 'message': 'Caché actualizada exitosamente',
                 'chain_length': len(chain),
-                'pending_transactions': len(pending_tx)
+                'pending_transactions': pending_count
             }
         else:
             return {
@@ -281,42 +414,51 @@ def update_cache_task(self) -> Dict:
         }
 
 
-@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.batch_process_transactions_task')
+def _summarize_batch(results: list, offset: int = 0) -> Dict:
+    """Totales del lote y elementos rechazados (posición en el lote original y motivo)"""
+    failed = []
+    for position, result in enumerate(results):
+        if not result['success']:
+            item = {'index': offset + position, 'error': result.get('error')}
+            if result.get('retry_after'):
+                item['retry_after'] = result['retry_after']
+            failed.append(item)
+    return {
+        'total': len(results),
+        'success_count': len(results) - len(failed),
+        'failed': failed
+    }
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.batch_process_transactions_task', priority=5)
 def batch_process_transactions_task(self, transactions: list) -> Dict:
     """
-    Tarea asíncrona para procesar múltiples transacciones en lote
+    Tarea asíncrona para procesar múltiples transacciones en lote.
+    El resultado solo incluye los totales y los elementos rechazados (posición
+    en el lote y motivo), no el eco de cada transacción.
+    Los lotes mayores que BATCH_CHUNK_SIZE se dividen en fragmentos que se
+    procesan en paralelo (group) y se agregan con un chord; el progreso por
+    fragmento se consulta en /tasks/{task_id} (estado PROGRESS).
     """
+    chunk_size = settings.BATCH_CHUNK_SIZE
+    if 0 < chunk_size < len(transactions):
+        chunks = [
+            process_transaction_chunk_task.s(transactions[offset:offset + chunk_size], offset, self.request.id, len(transactions))
+            for offset in range(0, len(transactions), chunk_size)
+        ]
+        # La tarea de agregación hereda el id de esta tarea
+        raise self.replace(chord(group(chunks), aggregate_batch_results_task.s(len(transactions))))
+    
     try:
         self.initialize_services()
         
-        results = []
-        for tx in transactions:
-            try:
-                success = self.blockchain_service.add_transaction(
-                    tx['sender'],
-                    tx['recipient'],
-                    float(tx['amount'])
-                )
-                results.append({
-                    'success': success,
-                    'transaction': tx
-                })
-            except Exception as e:
-                results.append({
-                    'success': False,
-                    'transaction': tx,
-                    'error': str(e)
-                })
+        summary = _summarize_batch(self.blockchain_service.add_transactions_batch(transactions))
         
-        success_count = sum(1 for r in results if r['success'])
-        
-        return {
-            'success': True,
-            'message': f'Procesadas {success_count}/{len(transactions)} transacciones',
-            'results': results,
-            'total': len(results),
-            'success_count': success_count
-        }
+        return dict(
+            summary,
+            success=True,
+            message=f"Procesadas {summary['success_count']}/{len(transactions)} transacciones"
+        )
     except Exception as e:
         error_msg = f"Error procesando lote de transacciones: {str(e)}"
         print(f"❌ {error_msg}")
@@ -325,3 +467,59 @@ def batch_process_transactions_task(self, transactions: list) -> Dict:
             'message': error_msg,
             'error': str(e)
         }
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.process_transaction_chunk_task', priority=4)
+def process_transaction_chunk_task(self, transactions: list, offset: int, batch_id: str, batch_total: int) -> Dict:
+    """Procesa un fragmento de un lote grande y publica el progreso del lote"""
+    self.initialize_services()
+    try:
+        summary = _summarize_batch(self.blockchain_service.add_transactions_batch(transactions), offset)
+    except Exception as e:
+        print(f"❌ Error procesando fragmento {offset} del lote {batch_id}: {e}")
+        summary = {
+            'total': len(transactions),
+            'success_count': 0,
+            'failed': [{'index': offset + position, 'error': str(e)} for position in range(len(transactions))]
+        }
+    
+    try:
+        progress_key = f"batch:{batch_id}:progress"
+        pipe = redis_client.client.pipeline()
+        pipe.hincrby(progress_key, 'processed', len(transactions))
+        pipe.hincrby(progress_key, 'success_count', summary['success_count'])
+        pipe.hincrby(progress_key, 'chunks_done', 1)
+        pipe.expire(progress_key, settings.BATCH_PROGRESS_TTL)
+        processed, success_count, chunks_done = pipe.execute()[:3]
+        self.backend.store_result(batch_id, {
+            'processed': processed,
+            'success_count': success_count,
+            'chunks_done': chunks_done,
+            'chunks_total': -(-batch_total // settings.BATCH_CHUNK_SIZE),
+            'total': batch_total
+        }, 'PROGRESS')
+    except Exception as e:
+        print(f"⚠️  No se pudo actualizar el progreso del lote {batch_id}: {e}")
+    return summary
+
+
+@celery_app.task(base=BlockchainTask, bind=True, name='src.tasks.aggregate_batch_results_task', priority=6)
+def aggregate_batch_results_task(self, chunk_summaries: list, batch_total: int) -> Dict:
+    """Combina los resúmenes de los fragmentos en el resultado del lote"""
+    failed = sorted(
+        (item for summary in chunk_summaries for item in summary['failed']),
+        key=lambda item: item['index']
+    )
+    success_count = sum(summary['success_count'] for summary in chunk_summaries)
+    try:
+        redis_client.client.delete(f"batch:{self.request.id}:progress")
+    except Exception:
+        pass
+    return {
+        'success': True,
+        'message': f'Procesadas {success_count}/{batch_total} transacciones',
+        'total': batch_total,
+        'success_count': success_count,
+        'failed': failed,
+        'chunks': len(chunk_summaries)
+    }
@@ -1,55 +1,229 @@
 import asyncio
-from typing import Dict, Set
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Set
 
 from fastapi import WebSocket
+from redis import asyncio as redis_asyncio
+
+from src.config import settings
+
+
+# Código de cierre para clientes que no consumen sus mensajes a tiempo
+# (1013: "Try Again Later")
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """
+    Conexión WebSocket con su cola de salida acotada, vaciada por su propia
+    tarea. Los balance_update pendientes de una misma dirección (y los
+    mempool_update pendientes) se reemplazan por el más reciente en lugar de
+    acumularse.
+    """
+
+    def __init__(self, websocket: WebSocket, max_pending: int) -> None:
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.pending: "OrderedDict[object, dict]" = OrderedDict()
+        self.task: Optional[asyncio.Task] = None
+        self.keys: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._seq = 0
+
+    @staticmethod
+    def _coalesce_key(message: dict):
+        if message.get("type") == "balance_update":
+            return ("balance_update", message.get("address"))
+        if message.get("type") == "mempool_update":
+            return ("mempool_update",)
+        return None
+
+    def offer(self, message: dict) -> bool:
+        """Encola un mensaje sin bloquear; retorna False si la cola está llena"""
+        key = self._coalesce_key(message)
+        if key is not None and key in self.pending:
+            self.pending[key] = message
+            return True
+        if len(self.pending) >= self.max_pending:
+            return False
+        if key is None:
+            self._seq += 1
+            key = ("seq", self._seq)
+        self.pending[key] = message
+        self._wakeup.set()
+        return True
+
+    async def run(self, on_failure: Callable) -> None:
+        try:
+            while True:
+                while not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                _, message = self.pending.popitem(last=False)
+                await asyncio.wait_for(self.websocket.send_json(message), timeout=settings.WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Envío fallido o demasiado lento
+            await on_failure(self)
 
 
 class WebSocketManager:
     """
-    Administra conexiones WebSocket por dirección de wallet.
-    Las direcciones se almacenan en minúsculas.
+    Administra conexiones WebSocket por clave (dirección de wallet o canal).
+    Las claves se almacenan en minúsculas.
+    Los envíos no esperan a los clientes: cada conexión tiene su cola y su
+    tarea de envío, y las que se quedan atrás (cola llena o envío que supera
+    WS_SEND_TIMEOUT) se cierran para no degradar al resto.
+
+    Con el backplane de Redis activo, publish() difunde el mensaje por el canal
+    pub/sub de la clave y lo entrega el proceso que tiene la conexión; cada
+    proceso se suscribe solo a las claves de sus conexiones locales.
     """
 
-    def __init__(self) -> None:
-        self._connections: Dict[str, Set[WebSocket]] = {}
+    def __init__(self, channel_prefix: str) -> None:
+        self._connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
         self._lock = asyncio.Lock()
+        self.channel_prefix = channel_prefix
+        self._redis = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    # ==================== Backplane (Redis pub/sub) ====================
+
+    async def enable_backplane(self) -> None:
+        """Conecta el backplane de Redis y se suscribe a las claves ya conectadas"""
+        self._redis = redis_asyncio.from_url(settings.redis_url, decode_responses=True)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        async with self._lock:
+            keys = list(self._connections)
+        if keys:
+            await self._pubsub.subscribe(*[self._channel(key) for key in keys])
+        self._reader = asyncio.create_task(self._read_backplane())
+
+    @property
+    def backplane_enabled(self) -> bool:
+        return self._redis is not None
+
+    def _channel(self, key: str) -> str:
+        return f"{self.channel_prefix}:{key}"
+
+    async def _read_backplane(self) -> None:
+        prefix_length = len(self.channel_prefix) + 1
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.5)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                await self.send_personal_message(message["channel"][prefix_length:], json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Error leyendo el backplane de WebSocket: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, key: str, message: dict) -> None:
+        """
+        Entrega un mensaje a las conexiones de la clave en cualquier proceso
+        (o solo en este si el backplane no está activo).
+        """
+        key = key.lower()
+        if self._redis is None:
+            await self.send_personal_message(key, message)
+            return
+        await self._redis.publish(self._channel(key), json.dumps(message))
+
+    async def subscribed_keys(self, keys: Iterable[str]) -> Set[str]:
+        """Claves de `keys` con al menos una conexión en algún proceso"""
+        keys = {key.lower() for key in keys}
+        if self._redis is None or not keys:
+            return keys & set(self._connections)
+        counts = await self._redis.pubsub_numsub(*[self._channel(key) for key in keys])
+        prefix_length = len(self.channel_prefix) + 1
+        return {channel[prefix_length:] for channel, count in counts if count > 0}
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
 
     async def connect(self, address: str, websocket: WebSocket) -> None:
-        address = address.lower()
+        await self.subscribe([address], websocket)
+
+    async def subscribe(self, keys: Iterable[str], websocket: WebSocket) -> None:
+        """Acepta la conexión y la registra bajo todas las claves indicadas"""
+        keys = {key.lower() for key in keys}
         await websocket.accept()
+        client = ClientConnection(websocket, settings.WS_SEND_QUEUE_SIZE)
+        client.keys = keys
+        client.task = asyncio.create_task(client.run(self._evict))
         async with self._lock:
-            if address not in self._connections:
-                self._connections[address] = set()
-            self._connections[address].add(websocket)
+            new_keys = [key for key in keys if key not in self._connections]
+            for key in keys:
+                self._connections.setdefault(key, {})[websocket] = client
+            if self._pubsub is not None and new_keys:
+                await self._pubsub.subscribe(*[self._channel(key) for key in new_keys])
 
     async def disconnect(self, address: str, websocket: WebSocket) -> None:
-        address = address.lower()
+        await self.unsubscribe([address], websocket)
+
+    async def unsubscribe(self, keys: Iterable[str], websocket: WebSocket) -> None:
+        tasks = set()
         async with self._lock:
-            if address in self._connections:
-                self._connections[address].discard(websocket)
-                if not self._connections[address]:
-                    del self._connections[address]
+            removed_keys = []
+            for key in {key.lower() for key in keys}:
+                clients = self._connections.get(key)
+                if clients is None:
+                    continue
+                client = clients.pop(websocket, None)
+                if not clients:
+                    del self._connections[key]
+                    removed_keys.append(key)
+                if client is not None and client.task is not None:
+                    tasks.add(client.task)
+            if self._pubsub is not None and removed_keys:
+                try:
+                    await self._pubsub.unsubscribe(*[self._channel(key) for key in removed_keys])
+                except Exception as e:
+                    print(f"⚠️  Error cancelando la suscripción al backplane: {e}")
+        for task in tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    async def _evict(self, client: ClientConnection) -> None:
+        await self.unsubscribe(client.keys, client.websocket)
+        try:
+            await client.websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception:
+            pass
+
+    def addresses(self) -> Set[str]:
+        """Claves con al menos una conexión abierta"""
+        return set(self._connections)
+
+    def has_subscribers(self, key: str) -> bool:
+        return key.lower() in self._connections
 
     async def send_personal_message(self, address: str, message: dict) -> None:
         """
-        Envía un mensaje a todas las conexiones asociadas a una dirección.
+        Encola un mensaje en todas las conexiones locales asociadas a una clave.
         """
         address = address.lower()
         async with self._lock:
-            connections = list(self._connections.get(address, set()))
-        if not connections:
-            return
-
-        data = message
-        for connection in connections:
-            try:
-                await connection.send_json(data)
-            except Exception:
-                # Si falla, intentamos desconectarlo silenciosamente
-                await self.disconnect(address, connection)
-
-
-ws_manager = WebSocketManager()
-
+            clients = list(self._connections.get(address, {}).values())
+        for client in clients:
+            if not client.offer(message):
+                asyncio.create_task(self._evict(client))
 
 
+# Conexiones por dirección de wallet (actualizaciones de balance)
+ws_manager = WebSocketManager("ws:wallet")
+# Conexiones por canal de eventos: "blocks", "mempool" y "task:<id>"
+events_manager = WebSocketManager("ws:events")
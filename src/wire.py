@@ -0,0 +1,137 @@
+"""
+Formato de los mensajes publicados en RabbitMQ.
+
+- json: formato verboso y legible (hash y monto formateado por transacción),
+  útil para depuración.
+- msgpack (v1): formato compacto. Cada transacción es una lista
+  [sender, recipient, amount, timestamp] y los montos que no caben en 64 bits
+  se codifican como ExtType. El consumidor puede recalcular los hashes.
+
+Los bloques se publican como eventos: la cabecera del bloque más el mapa de
+variación de balance por dirección (balance_deltas), calculado una vez por el
+minero. Quien necesite las transacciones las obtiene por hash (/block/{hash}).
+
+El formato se indica en el content_type del mensaje y la compresión opcional
+(zlib) en su content_encoding, de modo que los consumidores decodifican
+cualquier mensaje con independencia de la configuración del publicador.
+"""
+import json
+import zlib
+from src.config import settings
+from src.models import Transaction, Block
+from typing import Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependencia opcional
+    msgpack = None
+
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/x-msgpack'
+DEFLATE_ENCODING = 'deflate'
+WIRE_VERSION = 1
+
+# ExtType para enteros fuera del rango de 64 bits (montos en wei)
+BIGINT_EXT = 1
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _pack_int(value: int):
+    if _INT64_MIN <= value <= _INT64_MAX:
+        return value
+    length = (value.bit_length() + 8) // 8
+    return msgpack.ExtType(BIGINT_EXT, value.to_bytes(length, 'big', signed=True))
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == BIGINT_EXT:
+        return int.from_bytes(data, 'big', signed=True)
+    return msgpack.ExtType(code, data)
+
+
+def _compact_transaction(tx: Transaction) -> list:
+    return [
+        tx.sender,
+        tx.recipient,
+        _pack_int(int(tx.amount)),
+        tx.timestamp.isoformat() if tx.timestamp else None
+    ]
+
+
+def _expand_transaction(item: list) -> dict:
+    sender, recipient, amount, timestamp = item
+    return {'sender': sender, 'recipient': recipient, 'amount': amount, 'timestamp': timestamp}
+
+
+def block_event(block: Block, balance_deltas: Optional[Dict[str, int]] = None) -> dict:
+    """Evento de bloque minado: cabecera + variación de balance por dirección"""
+    return {
+        'index': block.index,
+        'timestamp': block.timestamp.isoformat(),
+        'previous_hash': block.previous_hash,
+        'hash': block.hash,
+        'nonce': block.nonce,
+        'tx_count': len(block.transactions),
+        'balance_deltas': balance_deltas if balance_deltas is not None else block.balance_deltas()
+    }
+
+
+def _to_json_payload(routing_key: str, payload):
+    if routing_key == 'transactions':
+        return [tx.to_dict() for tx in payload]
+    return payload
+
+
+def _to_compact_payload(routing_key: str, payload):
+    if routing_key == 'transactions':
+        return {'v': WIRE_VERSION, 'transactions': [_compact_transaction(tx) for tx in payload]}
+    if routing_key == 'blocks':
+        event = dict(payload, v=WIRE_VERSION)
+        event['balance_deltas'] = {
+            address: _pack_int(delta) for address, delta in payload.get('balance_deltas', {}).items()
+        }
+        return event
+    return payload
+
+
+def encode(routing_key: str, payload) -> Tuple[bytes, str, Optional[str]]:
+    """
+    Codifica un mensaje según WIRE_FORMAT.
+    payload: lista de Transaction ('transactions') o dict (eventos de bloque, etc.).
+    Retorna (cuerpo, content_type, content_encoding)
+    """
+    if settings.WIRE_FORMAT == 'msgpack' and msgpack is not None:
+        body = msgpack.packb(_to_compact_payload(routing_key, payload), use_bin_type=True)
+        content_type = MSGPACK_CONTENT_TYPE
+    else:
+        body = json.dumps(_to_json_payload(routing_key, payload)).encode()
+        content_type = JSON_CONTENT_TYPE
+
+    content_encoding = None
+    if 0 < settings.WIRE_COMPRESSION_MIN_BYTES <= len(body):
+        body = zlib.compress(body, 1)
+        content_encoding = DEFLATE_ENCODING
+    return body, content_type, content_encoding
+
+
+def decode(body: bytes, content_type: Optional[str] = None, content_encoding: Optional[str] = None):
+    """
+    Decodifica un mensaje a la forma de diccionarios del formato JSON
+    (los lotes compactos se expanden; sin hash ni monto formateado).
+    Los mensajes sin content_type se tratan como JSON (publicadores anteriores).
+    """
+    if content_encoding == DEFLATE_ENCODING:
+        body = zlib.decompress(body)
+    if content_type != MSGPACK_CONTENT_TYPE:
+        return json.loads(body)
+
+    if msgpack is None:
+        raise RuntimeError("Mensaje msgpack recibido pero el paquete msgpack no está instalado")
+    data = msgpack.unpackb(body, raw=False, ext_hook=_ext_hook)
+    if isinstance(data, dict) and data.get('v') == WIRE_VERSION:
+        if 'transactions' in data:
+            return [_expand_transaction(item) for item in data['transactions']]
+        data.pop('v')
+    return data
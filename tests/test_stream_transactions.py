@@ -0,0 +1,70 @@
+"""
+Ingesta NDJSON (/transactions/stream): el cuerpo llega en muchos fragmentos
+pequeños y cada línea debe aparecer exactamente una vez en la respuesta.
+"""
+import asyncio
+import json
+
+import src.api as api
+
+
+class FakeBlockchainService:
+    def add_transactions_batch(self, items):
+        return [{"success": True, "hash": f"tx-{item['n']}"} for item in items]
+
+
+def call_stream_endpoint(body: bytes, chunk_size: int) -> list:
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    sent = []
+
+    async def run():
+        pending = list(chunks)
+        never = asyncio.Event()
+
+        async def receive():
+            if pending:
+                data = pending.pop(0)
+                return {"type": "http.request", "body": data, "more_body": bool(pending)}
+            # Como un servidor real: después del cuerpo, receive() espera a la desconexión
+            await never.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/transactions/stream",
+            "raw_path": b"/transactions/stream",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/x-ndjson")],
+            "client": ("127.0.0.1", 12345),
+            "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(api.app(scope, receive, send), timeout=30)
+
+    asyncio.run(run())
+    body_out = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return [json.loads(line) for line in body_out.decode().splitlines() if line]
+
+
+def test_stream_keeps_every_line_with_small_chunks(monkeypatch):
+    monkeypatch.setattr(api, "blockchain_service", lambda: FakeBlockchainService())
+    total = 5000
+    body = "".join(
+        json.dumps({"n": n, "sender": "0xa", "recipient": "0xb", "amount": 1}) + "\n"
+        for n in range(1, total + 1)
+    ).encode()
+
+    output = call_stream_endpoint(body, chunk_size=37)
+
+    results = [entry for entry in output if "line" in entry]
+    assert sorted(entry["line"] for entry in results) == list(range(1, total + 1))
+    assert all(entry["success"] for entry in results)
+    assert [entry["hash"] for entry in results] == [f"tx-{n}" for n in range(1, total + 1)]
+    assert output[-1] == {"summary": {"total": total, "success_count": total}}